@@ -8,31 +8,23 @@ USAGE:
            --interval 1000   # resample every 1 000 m
 """
 
-import math
 import tkinter as tk
 from tkinter import filedialog
 
 import gpxpy
-import gpxpy.gpx
-from geopy.distance import geodesic
+import numpy as np
 
-def resample(track_points, interval_m):
-    """Yield points roughly every <interval_m> along the track."""
-    bucket = 0.0
-    if not track_points:
-        return
-    last = track_points[0]
-    yield last
-    for pt in track_points[1:]:
-        d = geodesic((last.latitude, last.longitude),
-                     (pt.latitude,  pt.longitude)).meters
-        bucket += d
-        if bucket >= interval_m:
-            yield pt
-            bucket = 0.0
-        last = pt
+from src.gpx_generator import fast_gpx_dump, resample_indices
+
+ROUTE_NAME = "Powiat-loop 200 km"
+
+def resample(lats, lons, interval_m):
+    """Return the (lats, lons) of points roughly every <interval_m> along the track."""
+    keep = resample_indices(lats, lons, float(interval_m))
+    return lats[keep], lons[keep]
 
 def build_route(in_gpx, interval, close_loop):
+    """Return the (lats, lons) arrays of the resampled route points."""
     print("--- GPX Structure --- ")
     print(f"Number of tracks found: {len(in_gpx.tracks)}")
     if not in_gpx.tracks:
@@ -54,29 +46,22 @@ def build_route(in_gpx, interval, close_loop):
         raise ValueError("No points found in the first segment of the first track.")
     print("-----------------------")
 
-    route = gpxpy.gpx.GPX()
-    gpx_rte = gpxpy.gpx.GPXRoute(name="Powiat-loop 200 km")
-    route.routes.append(gpx_rte)
+    # Work on contiguous coordinate arrays instead of GPXTrackPoint objects
+    lats = np.fromiter((p.latitude for p in points), dtype=np.float64, count=len(points))
+    lons = np.fromiter((p.longitude for p in points), dtype=np.float64, count=len(points))
 
-    resampled_points = list(resample(points, interval))
-    print(f"Number of points after resampling (interval: {interval}m): {len(resampled_points)}")
+    lats, lons = resample(lats, lons, interval)
+    print(f"Number of points after resampling (interval: {interval}m): {len(lats)}")
     
-    if not resampled_points:
+    if not len(lats):
         raise ValueError("Resampling resulted in no points. Check track data and interval.")
 
-    for p in resampled_points:
-        gpx_rte.points.append(gpxpy.gpx.GPXRoutePoint(p.latitude, p.longitude))
-
-    if close_loop and len(gpx_rte.points) > 0:
-        first = gpx_rte.points[0]
+    if close_loop:
         # Add the first point to the end only if it's not already the same as the last point
-        if len(gpx_rte.points) == 1 or \
-           (gpx_rte.points[-1].latitude != first.latitude or \
-            gpx_rte.points[-1].longitude != first.longitude):
-            gpx_rte.points.append(
-                gpxpy.gpx.GPXRoutePoint(first.latitude, first.longitude)
-            )
-    return route
+        if len(lats) == 1 or lats[-1] != lats[0] or lons[-1] != lons[0]:
+            lats = np.append(lats, lats[0])
+            lons = np.append(lons, lons[0])
+    return lats, lons
 
 def main():
     # Set up the root Tkinter window and hide it
@@ -123,11 +108,11 @@ def main():
         return
 
     try:
-        out_gpx = build_route(in_gpx, interval, close_loop)
+        lats, lons = build_route(in_gpx, interval, close_loop)
         with open(output_gpx_path, 'w', encoding='utf-8') as fh:
-            fh.write(out_gpx.to_xml())
+            fh.write(fast_gpx_dump(lats, lons, ROUTE_NAME, kind='rte'))
         print(f"\nSuccessfully created GPX route: {output_gpx_path}")
-        print(f"Total points in route: {len(out_gpx.routes[0].points)}")
+        print(f"Total points in route: {len(lats)}")
     except ValueError as ve:
         print(f"Error building route: {ve}")
     except Exception as e:
@@ -8,44 +8,35 @@ USAGE:
            --interval 1000   # resample every 1 000 m
 """
 
-import argparse, math, gpxpy, gpxpy.gpx
-from geopy.distance import geodesic
+import argparse, gpxpy
+import numpy as np
+from src.gpx_generator import fast_gpx_dump, resample_indices
 
-def resample(track_points, interval_m):
-    """Yield points roughly every <interval_m> along the track."""
-    bucket = 0.0
-    last = track_points[0]
-    yield last
-    for pt in track_points[1:]:
-        d = geodesic((last.latitude, last.longitude),
-                     (pt.latitude,  pt.longitude)).meters
-        bucket += d
-        if bucket >= interval_m:
-            yield pt
-            bucket = 0.0
-        last = pt
+ROUTE_NAME = "Powiat-loop 200 km"
+
+def resample(lats, lons, interval_m):
+    """Return the (lats, lons) of points roughly every <interval_m> along the track."""
+    keep = resample_indices(lats, lons, float(interval_m))
+    return lats[keep], lons[keep]
 
 def build_route(in_gpx, interval, close_loop):
-    points = []
-    for trk in in_gpx.tracks:
-        for seg in trk.segments:
-            points.extend(seg.points)
-    if not points:
+    """Return the (lats, lons) arrays of the resampled route points."""
+    n = sum(len(seg.points) for trk in in_gpx.tracks for seg in trk.segments)
+    if not n:
         raise ValueError("No <trkpt> data found in GPX.")
 
-    route = gpxpy.gpx.GPX()
-    gpx_rte = gpxpy.gpx.GPXRoute(name="Powiat-loop 200 km")
-    route.routes.append(gpx_rte)
+    # Work on contiguous coordinate arrays instead of GPXTrackPoint objects
+    lats = np.fromiter((p.latitude for trk in in_gpx.tracks for seg in trk.segments for p in seg.points),
+                       dtype=np.float64, count=n)
+    lons = np.fromiter((p.longitude for trk in in_gpx.tracks for seg in trk.segments for p in seg.points),
+                       dtype=np.float64, count=n)
 
-    for p in resample(points, interval):
-        gpx_rte.points.append(gpxpy.gpx.GPXRoutePoint(p.latitude, p.longitude))
+    lats, lons = resample(lats, lons, interval)
 
     if close_loop:
-        first = gpx_rte.points[0]
-        gpx_rte.points.append(
-            gpxpy.gpx.GPXRoutePoint(first.latitude, first.longitude)
-        )
-    return route
+        lats = np.append(lats, lats[0])
+        lons = np.append(lons, lons[0])
+    return lats, lons
 
 def main():
     ap = argparse.ArgumentParser()
@@ -60,9 +51,9 @@ def main():
     with open(args.input_gpx, encoding="utf-8") as fh:
         in_gpx = gpxpy.parse(fh)
 
-    out_gpx = build_route(in_gpx, args.interval, args.close_loop)
+    lats, lons = build_route(in_gpx, args.interval, args.close_loop)
     with open(args.output_gpx, "w", encoding="utf-8") as fh:
-        fh.write(out_gpx.to_xml())
+        fh.write(fast_gpx_dump(lats, lons, ROUTE_NAME, kind="rte"))
 
 if __name__ == "__main__":
     main()
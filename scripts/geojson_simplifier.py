@@ -1,13 +1,32 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import json
 import argparse
+import ijson
+import orjson
 import os
 import math
 from collections import defaultdict
+from contextlib import nullcontext
+from functools import partial
+from multiprocessing import Pool
 import numpy as np
-from shapely.geometry import LineString, mapping
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional: without it RDP runs as a plain Python loop
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+try:
+    from shapely.geometry import LineString
+except ImportError:
+    # Without shapely, plain RDP output is kept even where it self-intersects
+    LineString = None
+
+# Inputs larger than this are streamed with ijson instead of loaded at once
+STREAMING_THRESHOLD_BYTES = 256 * 1024 * 1024
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Calculate haversine distance between two points in meters"""
@@ -23,8 +42,105 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
+def path_length(coords):
+    """Calculate the haversine length of a [lon, lat] coordinate list in meters"""
+    R = 6371000  # Earth radius in meters
+    a = np.asarray(coords, dtype=np.float64)
+    lat = np.radians(a[:, 1])
+    lon = np.radians(a[:, 0])
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+
+    # cos(lat) is computed once per point and shared by both adjacent segments
+    cos_lat = np.cos(lat)
+
+    h = np.sin(dlat / 2.0) ** 2 + \
+        cos_lat[:-1] * cos_lat[1:] * \
+        np.sin(dlon / 2.0) ** 2
+    return float((2 * R * np.arcsin(np.sqrt(h))).sum())
+
+@njit(cache=True)
+def rdp(pts, eps):
+    """
+    Ramer-Douglas-Peucker simplification of an (N, 2) coordinate array.
+    
+    Uses an explicit stack instead of recursion and returns the indices of
+    the points to keep, in order. Like shapely's
+    simplify(preserve_topology=False), it does not guard against the result
+    self-intersecting or a ring collapsing; see _simplify_coords.
+    """
+    n = pts.shape[0]
+    keep = np.zeros(n, np.bool_)
+    if n == 0:
+        return np.nonzero(keep)[0]
+    keep[0] = True
+    keep[n - 1] = True
+    eps2 = eps * eps
+    
+    stack = np.empty((n, 2), np.int64)
+    stack[0, 0] = 0
+    stack[0, 1] = n - 1
+    top = 1
+    while top > 0:
+        top -= 1
+        first = stack[top, 0]
+        last = stack[top, 1]
+        if last - first < 2:
+            continue
+        
+        # Find the point furthest from the segment first -> last
+        ax = pts[first, 0]
+        ay = pts[first, 1]
+        dx = pts[last, 0] - ax
+        dy = pts[last, 1] - ay
+        seg_len2 = dx * dx + dy * dy
+        max_d2 = -1.0
+        max_idx = first
+        for k in range(first + 1, last):
+            px = pts[k, 0] - ax
+            py = pts[k, 1] - ay
+            if seg_len2 > 0.0:
+                t = (px * dx + py * dy) / seg_len2
+                t = min(max(t, 0.0), 1.0)
+                px -= t * dx
+                py -= t * dy
+            d2 = px * px + py * py
+            if d2 > max_d2:
+                max_d2 = d2
+                max_idx = k
+        
+        if max_d2 > eps2:
+            keep[max_idx] = True
+            stack[top, 0] = first
+            stack[top, 1] = max_idx
+            stack[top + 1, 0] = max_idx
+            stack[top + 1, 1] = last
+            top += 2
+    
+    return np.nonzero(keep)[0]
+
+def _simplify_coords(coords_arr, tolerance_degrees):
+    """
+    Simplify an (N, D) coordinate array, returning the simplified array.
+    
+    Runs the rdp() kernel first. Plain RDP can produce lines that the old
+    shapely simplify(preserve_topology=True) never emitted (self-intersecting
+    lines, rings collapsed to a segment), so those cases fall back to the
+    topology-preserving shapely simplify when shapely is installed.
+    """
+    keep = rdp(np.ascontiguousarray(coords_arr[:, :2]), tolerance_degrees)
+    simplified = coords_arr[keep]
+    if LineString is None:
+        return simplified
+    
+    is_ring = len(coords_arr) >= 4 and np.array_equal(coords_arr[0, :2], coords_arr[-1, :2])
+    if (is_ring and len(keep) < 4) or not LineString(simplified[:, :2]).is_simple:
+        fallback = LineString(coords_arr).simplify(tolerance_degrees, preserve_topology=True)
+        return np.asarray(fallback.coords, dtype=np.float64)
+    return simplified
+
 def get_line_hash(coords, precision=5):
-    """Create a hash of the line geometry (simplified) for duplicate detection"""
+    """Create a hashable key of the line geometry (simplified) for duplicate detection"""
     if len(coords) < 2:
         return None
     
@@ -42,16 +158,149 @@ def get_line_hash(coords, precision=5):
     if start > end:
         start, end = end, start
         
-    return f"{start[0]}:{start[1]}:{middle[0]}:{middle[1]}:{end[0]}:{end[1]}"
+    return (start, middle, end)
+
+def read_top_level_members(fp, skip='features'):
+    """Collect the top-level members of a GeoJSON object, without building <skip>"""
+    members = {}
+    key = None
+    builder = None
+    for prefix, event, value in ijson.parse(fp, use_float=True):
+        if prefix == '':
+            if event == 'map_key':
+                key = value
+                builder = ijson.ObjectBuilder() if key != skip else None
+            continue
+        if builder is None:
+            continue
+        builder.event(event, value)
+        # The member is complete once its own (non-nested) value has been closed
+        if prefix == key and event not in ('start_map', 'start_array', 'map_key'):
+            members[key] = builder.value
+            builder = None
+    return members
+
+def iter_features(input_file):
+    """Lazily yield the features of a GeoJSON FeatureCollection with ijson"""
+    with open(input_file, 'rb') as f:
+        yield from ijson.items(f, 'features.item', use_float=True)
+
+def load_geojson(input_file):
+    """
+    Load a GeoJSON FeatureCollection as (top-level members, features).
+    
+    Files up to STREAMING_THRESHOLD_BYTES are parsed in one go with orjson;
+    larger files are streamed with ijson so they never have to fit in memory.
+    """
+    if os.path.getsize(input_file) <= STREAMING_THRESHOLD_BYTES:
+        print(f"Loading GeoJSON from {input_file}...")
+        with open(input_file, 'rb') as f:
+            data = orjson.loads(f.read())
+        features = data.pop('features', [])
+        return data, features
+    
+    print(f"Streaming GeoJSON from {input_file}...")
+    with open(input_file, 'rb') as f:
+        members = read_top_level_members(f)
+    return members, iter_features(input_file)
+
+def _prefilter_features(features, keep_highway_types, remove_duplicates, counts, duplicate_hits):
+    """
+    Yield (feature, raw_hash) for the features worth simplifying, dropping cheap-to-detect rejects.
+    
+    Runs in the main process before features are handed to the workers:
+    non-LineStrings, unwanted highway types and exact duplicates of an
+    already seen raw geometry never reach the expensive length/simplify step.
+    Skips are tallied in <counts>; raw duplicates are tallied per raw hash in
+    <duplicate_hits>, since whether they count as duplicates or as too short
+    depends on how the first copy fares in the length filter.
+    """
+    unique_raw = set()
+    for i, feature in enumerate(features):
+        counts['total_original'] += 1
+        if (i + 1) % 100 == 0:
+            print(f"Processed {i + 1} segments...")
+        
+        if feature['geometry']['type'] != 'LineString':
+            continue
+        
+        # Check highway type
+        highway_type = feature['properties'].get('highway')
+        if keep_highway_types and highway_type not in keep_highway_types:
+            counts['skipped_highway_type'] += 1
+            continue
+        
+        raw_hash = None
+        if remove_duplicates:
+            raw_hash = get_line_hash(feature['geometry']['coordinates'])
+            if raw_hash is not None:
+                if raw_hash in unique_raw:
+                    duplicate_hits[raw_hash] += 1
+                    continue
+                unique_raw.add(raw_hash)
+        
+        yield feature, raw_hash
+
+def _process_feature(feature, tolerance_degrees, min_length):
+    """
+    Filter by length and simplify a single LineString feature.
+    
+    Runs in a worker process. Returns (feature, line_hash, stat_key) where
+    feature and line_hash are None if the feature was dropped, and stat_key
+    names the stats counter to increment (or None for uncounted skips).
+    """
+    # Get coordinates and simplify
+    coords = feature['geometry']['coordinates']
+    
+    # Skip if too few points
+    if len(coords) < 2:
+        return None, None, None
+    
+    coords_arr = np.asarray(coords, dtype=np.float64)
+        
+    # The bounding-box diagonal is a lower bound on the path length, so any
+    # feature whose box is already long enough passes without summing segments
+    bbox_min = coords_arr[:, :2].min(axis=0)
+    bbox_max = coords_arr[:, :2].max(axis=0)
+    bbox_diagonal = haversine_distance(bbox_min[1], bbox_min[0], bbox_max[1], bbox_max[0])
+        
+    # Skip if too short
+    if bbox_diagonal < min_length and path_length(coords_arr) < min_length:
+        return None, None, 'skipped_too_short'
+    
+    # Simplify with Douglas-Peucker algorithm
+    simplified = _simplify_coords(coords_arr, tolerance_degrees)
+    
+    # Skip if simplified too aggressively
+    if len(simplified) < 2:
+        return None, None, None
+        
+    # Update feature with simplified geometry
+    simplified_coords = simplified.tolist()
+    feature['geometry']['coordinates'] = simplified_coords
+    
+    return feature, get_line_hash(simplified_coords), 'kept'
+
+def _process_candidate(candidate, tolerance_degrees, min_length):
+    """Run _process_feature on a (feature, raw_hash) pair, passing raw_hash through."""
+    feature, raw_hash = candidate
+    return (*_process_feature(feature, tolerance_degrees, min_length), raw_hash)
 
 def simplify_geojson(input_file, output_file, tolerance=10, min_length=50, 
-                    keep_highway_types=None, remove_duplicates=True):
+                    keep_highway_types=None, remove_duplicates=True, workers=None):
     """
     Simplify a GeoJSON file by:
     1. Reducing coordinate points using Douglas-Peucker algorithm
     2. Removing duplicate roads
     3. Filtering by road type and minimum length
     
+    Features of large inputs are streamed from the input and written to the
+    output one at a time, so memory use does not grow with the size of the file.
+    Cheap filters (geometry/highway type, exact raw duplicates) run first in
+    the main process; length filtering and simplification then run in a pool
+    of worker processes, and the final duplicate check on the simplified
+    geometry happens in the main process as results arrive, in input order.
+    
     Args:
         input_file: Path to input GeoJSON
         output_file: Path to output simplified GeoJSON
@@ -59,99 +308,75 @@ def simplify_geojson(input_file, output_file, tolerance=10, min_length=50,
         min_length: Minimum length of road segment to keep (meters)
         keep_highway_types: List of highway types to keep (e.g. ['primary', 'secondary']) or None to keep all
         remove_duplicates: Whether to attempt to remove duplicate roads
+        workers: Number of worker processes (None for one per CPU, 1 to run in-process)
     """
-    print(f"Loading GeoJSON from {input_file}...")
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    features = data['features']
-    total_features = len(features)
-    print(f"Found {total_features} road segments in original file")
+    members, features = load_geojson(input_file)
     
     # Convert tolerance to approximate degrees
     # Rough approximation: 1 degree ~ 111km at equator
     tolerance_degrees = tolerance / 111000
     
-    simplified_features = []
-    unique_lines = {}  # For duplicate detection
+    unique_lines = set()  # For duplicate detection
     
     stats = {
-        'total_original': total_features,
+        'total_original': 0,
         'skipped_highway_type': 0,
         'skipped_too_short': 0,
         'skipped_duplicate': 0,
         'kept': 0
     }
-    
-    print(f"Processing and simplifying road segments...")
-    for i, feature in enumerate(features):
-        if (i + 1) % 100 == 0:
-            print(f"Processed {i + 1}/{total_features} segments...")
-        
-        if feature['geometry']['type'] != 'LineString':
-            continue
-        
-        # Check highway type
-        highway_type = feature['properties'].get('highway')
-        if keep_highway_types and highway_type not in keep_highway_types:
-            stats['skipped_highway_type'] += 1
-            continue
-        
-        # Get coordinates and simplify
-        coords = feature['geometry']['coordinates']
-        
-        # Skip if too few points
-        if len(coords) < 2:
-            continue
-            
-        # Calculate segment length
-        segment_length = 0
-        for i in range(len(coords) - 1):
-            segment_length += haversine_distance(
-                coords[i][1], coords[i][0],
-                coords[i+1][1], coords[i+1][0]
-            )
-            
-        # Skip if too short
-        if segment_length < min_length:
-            stats['skipped_too_short'] += 1
-            continue
-        
-        # Create LineString and simplify with Douglas-Peucker algorithm
-        line = LineString(coords)
-        simplified_line = line.simplify(tolerance_degrees)
-        
-        # Skip if simplified too aggressively
-        if len(simplified_line.coords) < 2:
-            continue
-            
-        # Update feature with simplified geometry
-        simplified_coords = list(mapping(simplified_line)['coordinates'])
-        feature['geometry']['coordinates'] = simplified_coords
-        
-        # Check for duplicates
-        if remove_duplicates:
-            line_hash = get_line_hash(simplified_coords)
-            if line_hash in unique_lines:
-                stats['skipped_duplicate'] += 1
-                continue
-            unique_lines[line_hash] = True
-        
-        simplified_features.append(feature)
-        stats['kept'] += 1
-    
-    # Create new GeoJSON
-    data['features'] = simplified_features
+    # Tallied separately: with a pool, the prefilter runs in its task feeder thread
+    prefilter_stats = dict.fromkeys(stats, 0)
+    duplicate_hits = defaultdict(int)  # Raw hash -> number of dropped exact copies
+    too_short_raw = set()  # Raw hashes whose first copy failed the length filter
     
     # Ensure output directory exists
     output_dir = os.path.dirname(output_file)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # Write the output
-    print(f"Writing simplified GeoJSON to {output_file}...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f)
+    candidates = _prefilter_features(features, keep_highway_types, remove_duplicates, prefilter_stats, duplicate_hits)
+    process = partial(_process_candidate, tolerance_degrees=tolerance_degrees, min_length=min_length)
+    
+    print(f"Streaming and simplifying road segments into {output_file}...")
+    with open(output_file, 'wb') as f_out, \
+            (Pool(workers) if workers != 1 else nullcontext()) as pool:
+        # Write everything except the features up front, then stream the features array
+        f_out.write(b'{')
+        for key, value in members.items():
+            f_out.write(orjson.dumps(key) + b':' + orjson.dumps(value) + b',')
+        f_out.write(b'"features":[')
+        
+        # Ordered imap keeps the output (and which duplicate wins) deterministic
+        results = pool.imap(process, candidates, chunksize=256) if pool else map(process, candidates)
+        for feature, line_hash, stat_key, raw_hash in results:
+            if feature is None:
+                if stat_key:
+                    stats[stat_key] += 1
+                if stat_key == 'skipped_too_short' and raw_hash is not None:
+                    too_short_raw.add(raw_hash)
+                continue
+            
+            # Check for duplicates
+            if remove_duplicates:
+                if line_hash in unique_lines:
+                    stats['skipped_duplicate'] += 1
+                    continue
+                unique_lines.add(line_hash)
+            
+            if stats['kept']:
+                f_out.write(b',')
+            f_out.write(orjson.dumps(feature))
+            stats['kept'] += 1
+        
+        f_out.write(b']}')
+    
+    for key, count in prefilter_stats.items():
+        stats[key] += count
+    # Exact copies share their first copy's length, so copies of a too-short
+    # segment are too short themselves rather than duplicates
+    for raw_hash, count in duplicate_hits.items():
+        stats['skipped_too_short' if raw_hash in too_short_raw else 'skipped_duplicate'] += count
     
     # Print statistics
     print("\nSimplification Statistics:")
@@ -160,7 +385,8 @@ def simplify_geojson(input_file, output_file, tolerance=10, min_length=50,
     print(f"Skipped (too short): {stats['skipped_too_short']}")
     print(f"Skipped (duplicate): {stats['skipped_duplicate']}")
     print(f"Kept segments: {stats['kept']}")
-    print(f"Reduction: {round(100 * (1 - stats['kept'] / stats['total_original']), 1)}%")
+    if stats['total_original']:
+        print(f"Reduction: {round(100 * (1 - stats['kept'] / stats['total_original']), 1)}%")
     
     print(f"\nSimplification completed successfully!")
     return stats
@@ -181,6 +407,8 @@ def parse_arguments():
                         help='Keep all highway types (overrides --highway-types)')
     parser.add_argument('--keep-duplicates', action='store_true',
                         help='Do not attempt to remove duplicate road segments')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of worker processes (default: one per CPU, 1 to disable multiprocessing)')
     
     args = parser.parse_args()
     
@@ -202,5 +430,6 @@ if __name__ == "__main__":
         tolerance=args.tolerance,
         min_length=args.min_length,
         keep_highway_types=highway_types,
-        remove_duplicates=not args.keep_duplicates
+        remove_duplicates=not args.keep_duplicates,
+        workers=args.workers
     )
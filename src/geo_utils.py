@@ -0,0 +1,120 @@
+"""
+Vectorized geographic distance helpers shared across the project.
+"""
+import numpy as np
+from pyproj import Geod
+
+try:
+    from numba import vectorize
+except ImportError:
+    # Numba is optional: the kernels below are written with NumPy functions,
+    # so undecorated they still work elementwise on arrays, just unfused
+    def vectorize(*args, **kwargs):
+        return lambda func: func
+
+EARTH_RADIUS_M = 6371008.8  # IUGG mean Earth radius in meters
+
+_GEOD = Geod(ellps='WGS84')
+
+@vectorize(['float64(float64, float64, float64, float64, float64, float64)'], fastmath=True, target='parallel', cache=True)
+def _haversine_rad_m(phi1, lam1, cos_phi1, phi2, lam2, cos_phi2):
+    """Fused haversine distance in meters from radians and precomputed cos(lat)."""
+    sin_dlat = np.sin((phi2 - phi1) * 0.5)
+    sin_dlon = np.sin((lam2 - lam1) * 0.5)
+    a = sin_dlat * sin_dlat + cos_phi1 * cos_phi2 * sin_dlon * sin_dlon
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+@vectorize(['float64(float64, float64, float64, float64)'], fastmath=True, target='parallel', cache=True)
+def _equirectangular_rad_m(phi1, lam1, phi2, lam2):
+    """Fused equirectangular distance in meters from radians."""
+    x = (lam2 - lam1) * np.cos(0.5 * (phi1 + phi2))
+    return EARTH_RADIUS_M * np.hypot(x, phi2 - phi1)
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Calculate haversine distances in meters between two sets of points.
+    
+    Runs the same fused Numba kernel as haversine_pairs_m; scalars are
+    broadcast against arrays.
+    
+    Args:
+        lat1, lon1: Latitudes/longitudes (degrees) of the start points, scalars or arrays
+        lat2, lon2: Latitudes/longitudes (degrees) of the end points, scalars or arrays
+        
+    Returns:
+        A NumPy array (or scalar) of distances in meters
+    """
+    phi1 = np.radians(np.asarray(lat1, dtype=np.float64))
+    phi2 = np.radians(np.asarray(lat2, dtype=np.float64))
+    lam1 = np.radians(np.asarray(lon1, dtype=np.float64))
+    lam2 = np.radians(np.asarray(lon2, dtype=np.float64))
+    return _haversine_rad_m(phi1, lam1, np.cos(phi1), phi2, lam2, np.cos(phi2))
+
+def haversine_pairs_m(lats, lons, u, v):
+    """
+    Calculate haversine distances in meters between pairs of points from a shared point table.
+    
+    The per-point radians and cos(lat) are computed once for the whole table
+    rather than once per pair, which halves the trigonometry when every point
+    takes part in several pairs (as graph nodes do); the per-pair formula
+    runs as one fused Numba ufunc.
+    
+    Args:
+        lats, lons: Arrays of point latitudes/longitudes in degrees
+        u, v: Integer index arrays; distance k is between points u[k] and v[k]
+        
+    Returns:
+        A NumPy array of distances in meters
+    """
+    # Coordinates may be stored as float32; do the trigonometry in float64
+    lat_rad = np.radians(np.asarray(lats, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat_rad)
+    
+    return _haversine_rad_m(lat_rad[u], lon_rad[u], cos_lat[u], lat_rad[v], lon_rad[v], cos_lat[v])
+
+def equirectangular_pairs_m(lats, lons, u, v, max_span_m=50000.0):
+    """
+    Calculate approximate distances in meters between pairs of points from a shared point table.
+    
+    Uses the equirectangular approximation (one cos and one hypot per pair,
+    fused into a single Numba ufunc), which stays within 0.1% of haversine
+    for pairs a few hundred meters apart, such as consecutive points along a
+    road. Pairs longer than max_span_m are recomputed with haversine_pairs_m.
+    
+    Args:
+        lats, lons: Arrays of point latitudes/longitudes in degrees
+        u, v: Integer index arrays; distance k is between points u[k] and v[k]
+        max_span_m: Approximate distance above which a pair falls back to haversine
+        
+    Returns:
+        A NumPy array of distances in meters
+    """
+    # Coordinates may be stored as float32; take differences in float64
+    lat_rad = np.radians(np.asarray(lats, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lons, dtype=np.float64))
+    
+    dist = _equirectangular_rad_m(lat_rad[u], lon_rad[u], lat_rad[v], lon_rad[v])
+    
+    long_pairs = np.flatnonzero(dist > max_span_m)
+    if len(long_pairs):
+        dist[long_pairs] = haversine_pairs_m(lats, lons, u[long_pairs], v[long_pairs])
+    return dist
+
+def geodesic_m(lat1, lon1, lat2, lon2):
+    """
+    Calculate WGS84 ellipsoidal (geodesic) distances in meters between two sets of points.
+    
+    Use this instead of haversine_m where full geodesic accuracy matters;
+    scalars are broadcast against arrays.
+    
+    Args:
+        lat1, lon1: Latitudes/longitudes (degrees) of the start points, scalars or arrays
+        lat2, lon2: Latitudes/longitudes (degrees) of the end points, scalars or arrays
+        
+    Returns:
+        A NumPy array of distances in meters
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2)))
+    _, _, dist = _GEOD.inv(lon1, lat1, lon2, lat2)
+    return np.asarray(dist)
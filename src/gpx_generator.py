@@ -1,13 +1,23 @@
 """
 GPX output generator module for creating Mapy.cz compatible GPX files.
 """
+import math
 import gpxpy
 import gpxpy.gpx
-from datetime import datetime
-from geopy.distance import geodesic
+from datetime import datetime, timezone
+import numpy as np
 import os
+from xml.sax.saxutils import escape, quoteattr
+from src.geo_utils import geodesic_m
 
-def create_gpx_route(coordinates, route_name="Optimized Route", route_description=None):
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional: without it the resampling kernel runs as a plain Python loop
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+def create_gpx_route(coordinates, route_name="Optimized Route", route_description=None, now=None):
     """
     Create a GPX route from a sequence of (latitude, longitude) coordinates.
     
@@ -15,6 +25,8 @@ def create_gpx_route(coordinates, route_name="Optimized Route", route_descriptio
         coordinates: List of (latitude, longitude) tuples representing the optimized route
         route_name: Name for the GPX route
         route_description: Optional description for the route
+        now: Optional naive UTC datetime to stamp the route with (defaults to the
+             current time); pass one shared value when generating routes in a batch
         
     Returns:
         A gpxpy.gpx.GPX object containing the route
@@ -33,18 +45,34 @@ def create_gpx_route(coordinates, route_name="Optimized Route", route_descriptio
     gpx_track.segments.append(gpx_segment)
     
     # Add points to our segment
-    for lat, lon in coordinates:
-        gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon))
+    GPXTrackPoint = gpxpy.gpx.GPXTrackPoint
+    gpx_segment.points.extend([GPXTrackPoint(lat, lon) for lat, lon in coordinates])
     
     # Add route metadata to make it more compatible with mapping services
     gpx.author_name = "ACO Route Optimizer"
     gpx.creator = "ACO Route Optimizer"
-    gpx.time = datetime.utcnow()
-    gpx.description = f"Optimized route with {len(coordinates)} points, created at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    if now is None:
+        now = datetime.utcnow()
+    created_at = now.replace(tzinfo=timezone.utc).astimezone().strftime('%Y-%m-%d %H:%M:%S')
+    gpx.time = now
+    gpx.description = f"Optimized route with {len(coordinates)} points, created at {created_at}"
     
     return gpx
 
-def resample_route(coordinates, interval=50):
+def _segment_distances(coordinates):
+    """
+    Calculate the length in meters of every consecutive segment of a route.
+    
+    Args:
+        coordinates: List of (latitude, longitude) tuples
+        
+    Returns:
+        A NumPy array with len(coordinates) - 1 distances
+    """
+    arr = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    return geodesic_m(arr[:-1, 0], arr[:-1, 1], arr[1:, 0], arr[1:, 1])
+
+def resample_route(coordinates, interval=50, segment_distances=None):
     """
     Resample a route to have points approximately every 'interval' meters.
     This can make the route smoother and reduce file size for very dense tracks.
@@ -52,32 +80,30 @@ def resample_route(coordinates, interval=50):
     Args:
         coordinates: List of (latitude, longitude) tuples
         interval: Distance in meters between resampled points
+        segment_distances: Optional precomputed result of _segment_distances(coordinates)
         
     Returns:
         A new list of (latitude, longitude) tuples
     """
     if not coordinates or len(coordinates) < 2:
         return coordinates
-        
-    resampled = [coordinates[0]]  # Start with the first point
-    distance_accumulator = 0
     
-    for i in range(1, len(coordinates)):
-        prev_point = coordinates[i-1]
-        curr_point = coordinates[i]
-        
-        segment_distance = geodesic(prev_point, curr_point).meters
-        
-        # If very close points, just skip to avoid unnecessary density
-        if segment_distance < 1.0:
-            continue
-            
-        distance_accumulator += segment_distance
-        
-        # If we've accumulated enough distance, add this point
-        if distance_accumulator >= interval:
-            resampled.append(curr_point)
-            distance_accumulator = 0
+    if segment_distances is None:
+        segment_distances = _segment_distances(coordinates)
+    
+    # Very close points don't count towards the interval to avoid unnecessary density
+    distances = np.where(segment_distances < 1.0, 0.0, segment_distances)
+    cumulative = np.concatenate(([0.0], np.cumsum(distances)))
+    
+    resampled = [coordinates[0]]  # Start with the first point
+    last_index = 0
+    while True:
+        # Next point is the first one at least 'interval' meters past the last kept point
+        next_index = int(np.searchsorted(cumulative, cumulative[last_index] + interval))
+        if next_index >= len(coordinates):
+            break
+        resampled.append(coordinates[next_index])
+        last_index = next_index
             
     # Always include the last point
     if coordinates[-1] != resampled[-1]:
@@ -85,12 +111,51 @@ def resample_route(coordinates, interval=50):
         
     return resampled
 
-def calculate_route_statistics(coordinates):
+@njit(cache=True)
+def resample_indices(lats, lons, interval_m):
+    """
+    Pick the points kept when resampling a track roughly every 'interval_m' meters.
+    Used by the standalone route scripts, which keep their points in coordinate arrays.
+    
+    Args:
+        lats: Array of latitudes in degrees
+        lons: Array of longitudes in degrees
+        interval_m: Distance in meters between kept points
+        
+    Returns:
+        An int64 array of the kept point indices, starting with 0
+    """
+    n = lats.shape[0]
+    keep = np.empty(n, np.int64)
+    if n == 0:
+        return keep
+    keep[0] = 0
+    count = 1
+    bucket = 0.0
+    # Equirectangular "cheap ruler": metres per degree of lon/lat around
+    # ref_lat, refreshed whenever the track drifts ~1 degree north or south.
+    ref_lat = lats[0]
+    kx = math.cos(math.radians(ref_lat)) * 111320.0
+    ky = 110540.0
+    for i in range(1, n):
+        if abs(lats[i] - ref_lat) > 1.0:
+            ref_lat = lats[i]
+            kx = math.cos(math.radians(ref_lat)) * 111320.0
+        bucket += math.hypot((lons[i] - lons[i - 1]) * kx,
+                             (lats[i] - lats[i - 1]) * ky)
+        if bucket >= interval_m:
+            keep[count] = i
+            count += 1
+            bucket = 0.0
+    return keep[:count]
+
+def calculate_route_statistics(coordinates, segment_distances=None):
     """
     Calculate statistics for a route.
     
     Args:
         coordinates: List of (latitude, longitude) tuples
+        segment_distances: Optional precomputed result of _segment_distances(coordinates)
         
     Returns:
         Dictionary with route statistics
@@ -101,19 +166,92 @@ def calculate_route_statistics(coordinates):
             "num_points": len(coordinates) if coordinates else 0
         }
     
-    total_distance = 0
-    
-    for i in range(1, len(coordinates)):
-        prev_point = coordinates[i-1]
-        curr_point = coordinates[i]
-        segment_distance = geodesic(prev_point, curr_point).meters
-        total_distance += segment_distance
+    if segment_distances is None:
+        segment_distances = _segment_distances(coordinates)
+    total_distance = float(segment_distances.sum())
         
     return {
         "total_distance_km": total_distance / 1000.0,
         "num_points": len(coordinates)
     }
 
+def fast_gpx_dump(lats, lons, name, kind='rte', description=None, creator="ACO Route Optimizer",
+                  metadata_description=None, author_name=None, time=None):
+    """
+    Serialize a single route or track of plain lat/lon points to GPX 1.1 XML.
+    
+    This bypasses gpxpy's generic XML writer, which is slow for files with
+    tens of thousands of points.
+    
+    Args:
+        lats: Sequence of point latitudes
+        lons: Sequence of point longitudes
+        name: Name of the route/track
+        kind: 'rte' to write a <rte> route, 'trk' to write a single-segment <trk> track
+        description: Optional description for the route/track
+        creator: Value of the GPX creator attribute
+        metadata_description: Optional document-level description (<metadata><desc>)
+        author_name: Optional document author (<metadata><author><name>)
+        time: Optional datetime written as the document timestamp (<metadata><time>)
+        
+    Returns:
+        The GPX document as a string
+    """
+    if kind == 'rte':
+        point_tag, seg_open, seg_close = 'rtept', '', ''
+    elif kind == 'trk':
+        point_tag, seg_open, seg_close = 'trkpt', '<trkseg>\n', '\n</trkseg>'
+    else:
+        raise ValueError(f"Unsupported GPX element kind: {kind}")
+    
+    header = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx xmlns="http://www.topografix.com/GPX/1/1" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd" '
+        f'version="1.1" creator={quoteattr(creator)}>\n'
+    )
+    if metadata_description or author_name or time:
+        header += '<metadata>\n'
+        if metadata_description:
+            header += f'<desc>{escape(metadata_description)}</desc>\n'
+        if author_name:
+            header += f'<author>\n<name>{escape(author_name)}</name>\n</author>\n'
+        if time:
+            header += f'<time>{time.strftime("%Y-%m-%dT%H:%M:%SZ")}</time>\n'
+        header += '</metadata>\n'
+    header += f'<{kind}>\n<name>{escape(name)}</name>\n'
+    if description:
+        header += f'<desc>{escape(description)}</desc>\n'
+    
+    points = "\n".join(f'<{point_tag} lat="{la:.6f}" lon="{lo:.6f}"/>' for la, lo in zip(lats, lons))
+    
+    return "".join((header, seg_open, points, seg_close, f'\n</{kind}>\n</gpx>\n'))
+
+_UNSET = (None, '', [], {})
+
+def _only_fields_set(gpx_element, allowed):
+    """True if every gpxpy attribute of gpx_element outside allowed is unset."""
+    return all(getattr(gpx_element, slot) in _UNSET
+               for slot in gpx_element.__slots__ if slot not in allowed)
+
+def _is_plain_track(gpx_object):
+    """
+    True if the GPX holds nothing but what fast_gpx_dump writes: one track with
+    a name and description, one segment of bare lat/lon points, and the
+    document creator, description, author name and time.
+    """
+    if len(gpx_object.tracks) != 1 or len(gpx_object.tracks[0].segments) != 1:
+        return False
+    if gpx_object.version not in (None, '1.1'):
+        return False
+    track = gpx_object.tracks[0]
+    segment = track.segments[0]
+    return (_only_fields_set(gpx_object, ('version', 'creator', 'description', 'author_name', 'time', 'tracks'))
+            and _only_fields_set(track, ('name', 'description', 'segments'))
+            and _only_fields_set(segment, ('points',))
+            and all(_only_fields_set(point, ('latitude', 'longitude')) for point in segment.points))
+
 def save_gpx_file(gpx_object, output_file_path):
     """
     Save a GPX object to a file.
@@ -128,16 +266,32 @@ def save_gpx_file(gpx_object, output_file_path):
     # Make sure the output directory exists
     os.makedirs(os.path.dirname(os.path.abspath(output_file_path)), exist_ok=True)
     
+    # A single plain track (as built by create_gpx_route) goes through the
+    # fast writer; anything it would not write goes through gpxpy
+    if _is_plain_track(gpx_object):
+        track = gpx_object.tracks[0]
+        points = track.segments[0].points
+        xml = fast_gpx_dump(
+            [p.latitude for p in points], [p.longitude for p in points],
+            track.name or "", kind='trk', description=track.description,
+            creator=gpx_object.creator or "ACO Route Optimizer",
+            metadata_description=gpx_object.description,
+            author_name=gpx_object.author_name, time=gpx_object.time
+        )
+    else:
+        xml = gpx_object.to_xml()
+    
     # Write the GPX data to file
-    with open(output_file_path, 'w') as f:
-        f.write(gpx_object.to_xml())
+    with open(output_file_path, 'w', encoding='utf-8') as f:
+        f.write(xml)
         
     return output_file_path
 
 def convert_route_to_mapy_cz_compatible_gpx(route_coordinates, output_file_path, 
                                           route_name="Optimized Route", 
                                           route_description=None,
-                                          resample_interval=50):
+                                          resample_interval=50,
+                                          now=None):
     """
     Convert a list of coordinates to a Mapy.cz compatible GPX file.
     
@@ -147,23 +301,28 @@ def convert_route_to_mapy_cz_compatible_gpx(route_coordinates, output_file_path,
         route_name: Name for the GPX route
         route_description: Optional description for the route
         resample_interval: Interval in meters for resampling points (0 to disable)
+        now: Optional naive UTC datetime to stamp the route with (see create_gpx_route)
         
     Returns:
         Dictionary with statistics and the path to the saved file
     """
+    # Segment lengths are computed once and shared by resampling and statistics
+    segment_distances = _segment_distances(route_coordinates)
+    
     # Optionally resample the route
     processed_route = route_coordinates
     if resample_interval > 0:
-        processed_route = resample_route(route_coordinates, resample_interval)
+        processed_route = resample_route(route_coordinates, resample_interval, segment_distances)
     
     # Create GPX object
-    gpx = create_gpx_route(processed_route, route_name, route_description)
+    gpx = create_gpx_route(processed_route, route_name, route_description, now=now)
     
     # Save to file
     save_path = save_gpx_file(gpx, output_file_path)
     
-    # Calculate statistics
-    stats = calculate_route_statistics(processed_route)
+    # Calculate statistics (distance is measured along the full, unresampled route)
+    stats = calculate_route_statistics(route_coordinates, segment_distances)
+    stats["num_points"] = len(processed_route)
     stats["original_point_count"] = len(route_coordinates)
     stats["output_point_count"] = len(processed_route)
     stats["output_file"] = save_path
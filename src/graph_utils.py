@@ -1,67 +1,540 @@
 import networkx as nx
-from geopy.distance import geodesic
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from src.geo_utils import equirectangular_pairs_m
+import hashlib
+import logging
+import os
 import time
 from collections import defaultdict
 
-def create_road_network_graph(segments):
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional: without it the graph kernels run as plain Python loops
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+logger = logging.getLogger(__name__)
+
+# Points interned per batch by create_road_network_graph (16 bytes each as float64)
+INTERN_BATCH_POINTS = 1_000_000
+
+def pack_coordinates(lats, lons, decimals=6):
+    """
+    Packs latitude/longitude pairs into single int64 keys.
+
+    Each coordinate is rounded to the given number of decimal places and
+    stored as 32-bit fixed point, so points that agree to that precision
+    share a key.
+
+    Args:
+        lats: Array of latitudes in degrees.
+        lons: Array of longitudes in degrees.
+        decimals: Decimal places kept per coordinate (at most 7 to fit 32 bits).
+
+    Returns:
+        An int64 array with one key per point.
+    """
+    scale = 10.0 ** decimals
+    lat_fixed = np.round((np.asarray(lats, dtype=np.float64) + 90.0) * scale).astype(np.int64)
+    lon_fixed = np.round((np.asarray(lons, dtype=np.float64) + 180.0) * scale).astype(np.int64)
+    return (lat_fixed << 32) | lon_fixed
+
+def _shortest_parallel_edges(u_arr, v_arr, weights):
+    """
+    Reduces undirected edge arrays to one edge per endpoint pair, keeping the shortest.
+
+    Edges are sorted by endpoint pair and then by weight, and the first of
+    each pair is kept.
+
+    Returns:
+        A (lo, hi, weights) tuple with lo < hi for each edge (lo == hi for loops).
+    """
+    lo = np.minimum(u_arr, v_arr)
+    hi = np.maximum(u_arr, v_arr)
+    order = np.lexsort((weights, hi, lo))
+    lo, hi, weights = lo[order], hi[order], weights[order]
+    first = np.ones(len(lo), dtype=bool)
+    first[1:] = (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+    return lo[first], hi[first], weights[first]
+
+class _NodeInterner:
+    """
+    Assigns integer node IDs to segment points batch by batch.
+
+    Points whose packed keys (see pack_coordinates) match become one node,
+    positioned at the first such point seen. finish() renumbers the nodes
+    in key order, so the IDs do not depend on how the segments were batched.
+    """
+
+    def __init__(self, decimals):
+        self.decimals = decimals
+        self.sorted_keys = np.empty(0, dtype=np.int64)  # Unique keys seen so far, sorted
+        self.sorted_ids = np.empty(0, dtype=np.int64)   # Node ID of each sorted key
+        self.coord_batches = []  # Per batch, the (lat, lon) rows of its new nodes
+        self.edge_batches = []   # Per batch, the (u, v) node ID arrays of its edges
+        self.num_nodes = 0
+
+    def add_segments(self, segment_arrays):
+        """Interns one batch of (n, 2) segment arrays and records their edges."""
+        points = np.concatenate(segment_arrays)
+        keys = pack_coordinates(points[:, 0], points[:, 1], self.decimals)
+        batch_keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+        # Look the batch's keys up among the known ones; the rest are new nodes
+        pos = np.searchsorted(self.sorted_keys, batch_keys)
+        known = pos < len(self.sorted_keys)
+        known[known] = self.sorted_keys[pos[known]] == batch_keys[known]
+        batch_ids = np.empty(len(batch_keys), dtype=np.int64)
+        batch_ids[known] = self.sorted_ids[pos[known]]
+        new = ~known
+        num_new = int(np.count_nonzero(new))
+        batch_ids[new] = np.arange(self.num_nodes, self.num_nodes + num_new)
+        self.num_nodes += num_new
+        self.coord_batches.append(points[first_index[new]])
+        # batch_keys is sorted, so the new keys insert in order at pos
+        self.sorted_keys = np.insert(self.sorted_keys, pos[new], batch_keys[new])
+        self.sorted_ids = np.insert(self.sorted_ids, pos[new], batch_ids[new])
+
+        # Consecutive points form edges, except across the boundary between
+        # one segment's last point and the next segment's first; points that
+        # intern to the same node would only form self-loops
+        node_ids = batch_ids[inverse.reshape(-1)]
+        within_segment = np.ones(len(node_ids) - 1, dtype=bool)
+        segment_ends = np.cumsum([len(segment) for segment in segment_arrays])
+        within_segment[segment_ends[:-1] - 1] = False
+        u_arr = node_ids[:-1][within_segment]
+        v_arr = node_ids[1:][within_segment]
+        distinct = u_arr != v_arr
+        self.edge_batches.append((u_arr[distinct], v_arr[distinct]))
+
+    def finish(self):
+        """
+        Returns:
+            A (coords, u_arr, v_arr) tuple: the (n, 2) float64 node positions
+            indexed by node ID, and the endpoint IDs of every edge.
+        """
+        coords = np.concatenate(self.coord_batches) if self.coord_batches else np.empty((0, 2), dtype=np.float64)
+        # Renumber nodes in key order
+        new_ids = np.empty(self.num_nodes, dtype=np.int64)
+        new_ids[self.sorted_ids] = np.arange(self.num_nodes)
+        coords = coords[self.sorted_ids]
+        if self.edge_batches:
+            u_arr = new_ids[np.concatenate([u for u, _ in self.edge_batches])]
+            v_arr = new_ids[np.concatenate([v for _, v in self.edge_batches])]
+        else:
+            u_arr = v_arr = np.empty(0, dtype=np.int64)
+        return coords, u_arr, v_arr
+
+def create_road_network_graph(segments, decimals=6):
     """
-    Creates a road network graph from a list of road segments.
+    Creates a road network graph from road segments.
 
     Args:
-        segments: A list of segments, where each segment is a list of 
-                  (latitude, longitude) coordinate tuples.
+        segments: An iterable of segments (a list, or a generator such as
+                  parsers.iter_gpx_segments), where each segment is a list of
+                  (latitude, longitude) coordinate tuples or an (n, 2) array.
+        decimals: Points that agree to this many decimal places (1e-6 degrees
+                  is about 0.1 m) become the same node, so float noise between
+                  segments or source files does not split junctions.
 
     Returns:
-        A networkx.MultiGraph representing the road network.
-        Nodes are coordinate tuples (lat, lon).
-        Edges have a 'weight' attribute representing the length in meters.
+        A networkx.Graph representing the road network.
+        Nodes are integer IDs with a 'pos' attribute holding the (lat, lon) tuple;
+        graph.graph['coords'] holds the same positions as an (n, 2) float32 array
+        indexed by node ID.
+        Edges have a 'weight' attribute representing the length in meters;
+        parallel edges between the same two nodes keep the shortest length.
     """
-    if not segments:
-        print("No segments provided to create graph.")
+    if segments is None:
+        logger.error("No segments provided to create graph.")
         return None
 
-    graph = nx.MultiGraph()
-    
-    # Helper to add an edge with its calculated weight (length)
-    def add_edge_with_weight(u_coord, v_coord):
-        if u_coord == v_coord: # Skip zero-length segments if any point duplicates
-            return
-        length = geodesic(u_coord, v_coord).meters
-        graph.add_edge(u_coord, v_coord, weight=length)
-
-    print(f"Building graph from {len(segments)} segments...")
+    graph = nx.Graph()
+
+    # Generators have no length; progress is then reported without a total
+    total_segments = f"/{len(segments)}" if hasattr(segments, '__len__') else ""
+    logger.info("Building graph from %s segments...", len(segments) if total_segments else 'streamed')
     processed_segments = 0
+    # Segments are interned in batches, so only one batch of raw points is
+    # held at a time; across batches just the unique node keys and the edge
+    # index pairs accumulate
+    interner = _NodeInterner(decimals)
+    batch = []
+    batch_points = 0
 
     for segment_points in segments:
         if len(segment_points) < 2:
             # A segment needs at least two points to form an edge
             continue
-        
-        # Add edges for each pair of consecutive points in the segment
-        for i in range(len(segment_points) - 1):
-            u_node = segment_points[i]
-            v_node = segment_points[i+1]
-            
-            # Ensure nodes exist in the graph (NetworkX adds them automatically if not)
-            # graph.add_node(u_node, pos=u_node) # Optional: store position for plotting
-            # graph.add_node(v_node, pos=v_node)
-            
-            add_edge_with_weight(u_node, v_node)
+        segment_array = np.asarray(segment_points, dtype=np.float64).reshape(-1, 2)
+        batch.append(segment_array)
+        batch_points += len(segment_array)
+        if batch_points >= INTERN_BATCH_POINTS:
+            interner.add_segments(batch)
+            batch = []
+            batch_points = 0
         
         processed_segments += 1
         if processed_segments % 100 == 0:
-            print(f"Processed {processed_segments}/{len(segments)} segments...")
+            logger.debug("Processed %d%s segments...", processed_segments, total_segments)
+
+    if batch:
+        interner.add_segments(batch)
+    coords, u_arr, v_arr = interner.finish()
+
+    # Interning and edge lengths use the full float64 coordinates; only the
+    # stored positions are downcast (float32 steps are ~0.4 m at these latitudes)
+    stored_coords = coords.astype(np.float32)
+    graph.add_nodes_from((node_id, {'pos': pos}) for node_id, pos in enumerate(map(tuple, stored_coords.tolist())))
+    graph.graph['coords'] = stored_coords
+
+    # Every pair of consecutive points in a segment is an edge; compute all
+    # edge lengths in one vectorized pass (equirectangular, as edges are short)
+    if len(u_arr):
+        weights = equirectangular_pairs_m(coords[:, 0], coords[:, 1], u_arr, v_arr)
+        # Collapse parallel edges to the shortest one before inserting
+        lo, hi, weights = _shortest_parallel_edges(u_arr, v_arr, weights)
+        graph.add_weighted_edges_from(zip(lo.tolist(), hi.tolist(), weights.tolist()))
 
-    print(f"Finished building graph. Processed {processed_segments} segments.")
-    print(f"Graph has {graph.number_of_nodes()} nodes and {graph.number_of_edges()} edges.")
+    # Segments made up of a single repeated point leave isolated nodes behind
+    graph.remove_nodes_from(list(nx.isolates(graph)))
+
+    logger.info("Finished building graph. Processed %d segments.", processed_segments)
+    logger.info("Graph has %d nodes and %d edges.", graph.number_of_nodes(), graph.number_of_edges())
     
     if graph.number_of_nodes() == 0 or graph.number_of_edges() == 0:
-        print("Warning: The created graph is empty or has no edges.")
+        logger.warning("The created graph is empty or has no edges.")
         return None
         
     return graph
 
-def simplify_graph(graph, junction_degree_threshold=3, max_nodes=500, verbose=True):
+class CSRGraph:
+    """
+    Compressed sparse row (CSR) adjacency of an undirected road network graph.
+
+    Row i lists the neighbors of node index i as nbrs[indptr[i]:indptr[i+1]],
+    with the matching edge lengths in the same slice of weights. Each
+    undirected edge is stored once in each direction. Node index i is
+    nodelist[i] in the originating networkx graph.
+    """
+
+    def __init__(self, indptr, nbrs, weights, nodelist):
+        self.indptr = indptr
+        self.nbrs = nbrs
+        self.weights = weights
+        self.nodelist = nodelist
+
+    @classmethod
+    def from_edges(cls, u, v, w, nodelist):
+        """
+        Builds a CSRGraph from undirected edge arrays.
+
+        Args:
+            u, v: Integer arrays of edge endpoints (node indices)
+            w: Array of edge weights
+            nodelist: Node ordering; node index i corresponds to nodelist[i]
+
+        Returns:
+            A CSRGraph with int32 indices and float32 weights.
+        """
+        num_nodes = len(nodelist)
+        rows = np.concatenate((u, v)).astype(np.int64)
+        cols = np.concatenate((v, u))
+        data = np.concatenate((w, w))
+
+        # Group both directions of every edge by source node
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(num_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+        return cls(indptr, cols[order].astype(np.int32), data[order].astype(np.float32), nodelist)
+
+    @classmethod
+    def from_networkx(cls, graph, nodelist=None):
+        """
+        Builds a CSRGraph from a networkx.Graph with 'weight' edge attributes.
+
+        A MultiGraph is accepted too; its parallel edges are collapsed to the
+        shortest one, which is all that shortest-path and tour code needs.
+
+        Args:
+            graph: A networkx.Graph or MultiGraph
+            nodelist: Optional node ordering. Defaults to the graph's node iteration order.
+
+        Returns:
+            A CSRGraph.
+        """
+        if nodelist is None:
+            nodelist = list(graph.nodes())
+        node_index = {node: i for i, node in enumerate(nodelist)}
+
+        edges = [(node_index[u], node_index[v], w) for u, v, w in graph.edges(data='weight', default=1.0)]
+        if edges:
+            u_arr, v_arr, w_arr = (np.asarray(col) for col in zip(*edges))
+        else:
+            u_arr = v_arr = np.empty(0, dtype=np.int64)
+            w_arr = np.empty(0, dtype=np.float64)
+        if graph.is_multigraph():
+            u_arr, v_arr, w_arr = _shortest_parallel_edges(u_arr, v_arr, w_arr)
+        return cls.from_edges(u_arr, v_arr, w_arr, nodelist)
+
+    @property
+    def num_nodes(self):
+        return len(self.indptr) - 1
+
+    def neighbors(self, i):
+        """Returns a view of the neighbor indices of node index i."""
+        return self.nbrs[self.indptr[i]:self.indptr[i + 1]]
+
+    def neighbor_weights(self, i):
+        """Returns a view of the edge weights to the neighbors of node index i."""
+        return self.weights[self.indptr[i]:self.indptr[i + 1]]
+
+    def to_scipy(self):
+        """Returns the adjacency as a SciPy csr_matrix."""
+        return csr_matrix((self.weights, self.nbrs, self.indptr), shape=(self.num_nodes, self.num_nodes))
+
+def graph_to_csr(graph, nodelist=None):
+    """
+    Converts a road network graph into a symmetric SciPy CSR adjacency matrix.
+
+    The CSR form is what scipy.sparse.csgraph routines (e.g. dijkstra) work on,
+    and is far cheaper to traverse than NetworkX's nested dicts.
+
+    Args:
+        graph: A networkx.Graph with 'weight' edge attributes
+        nodelist: Optional node ordering; row/column i corresponds to nodelist[i].
+                  Defaults to the graph's node iteration order.
+
+    Returns:
+        A (csr_matrix, nodelist) tuple.
+    """
+    csr_graph = CSRGraph.from_networkx(graph, nodelist)
+    return csr_graph.to_scipy(), csr_graph.nodelist
+
+def shortest_path_matrix(graph, nodelist=None, cache_dir='cache'):
+    """
+    Computes the all-pairs shortest-path distance matrix of a road network graph.
+
+    Distances are computed with SciPy's compiled Dijkstra over the CSR adjacency
+    and, when cache_dir is set, stored as cache_dir/apsp_<hash>.npz where the hash
+    covers the graph's edges and node ordering, so later runs on the same graph
+    load the matrix instead of recomputing it.
+
+    Args:
+        graph: A networkx.Graph with 'weight' edge attributes
+        nodelist: Optional node ordering; dist[i, j] is the distance from
+                  nodelist[i] to nodelist[j]. Defaults to the graph's node order.
+        cache_dir: Directory for cached matrices, or None to disable caching
+
+    Returns:
+        A (num_nodes, num_nodes) float64 NumPy array of distances in meters;
+        unreachable pairs are inf.
+    """
+    csr, nodelist = graph_to_csr(graph, nodelist)
+
+    cache_path = None
+    if cache_dir:
+        digest = hashlib.sha1()
+        for arr in (csr.indptr, csr.indices, csr.data):
+            digest.update(np.ascontiguousarray(arr).tobytes())
+        cache_path = os.path.join(cache_dir, f"apsp_{digest.hexdigest()}.npz")
+        if os.path.exists(cache_path):
+            logger.info("Loading cached shortest-path distances from %s", cache_path)
+            with np.load(cache_path) as cached:
+                return cached['dist']
+
+    logger.info("Computing shortest-path distances between %d nodes...", len(nodelist))
+    dist = dijkstra(csr, directed=False)
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(cache_path, dist=dist)
+        logger.debug("Cached shortest-path distances to %s", cache_path)
+
+    return dist
+
+@njit(cache=True)
+def _collapse_chains(indptr, nbrs, weights, is_junction):
+    """
+    Collapses every chain of degree-2 nodes between junctions into one edge.
+
+    Walks out from each junction along each of its edges until the next
+    junction is reached, summing the edge weights on the way. Chain nodes
+    are marked as visited so each chain is walked only once; rings of
+    degree-2 nodes that never reach a junction are dropped.
+
+    Args:
+        indptr: CSR row pointers
+        nbrs: CSR column indices
+        weights: CSR edge weights
+        is_junction: Boolean mask of the nodes to keep (degree != 2)
+
+    Returns:
+        A (u, v, w) tuple of edge arrays between junction node indices. May
+        contain parallel edges and self-loops.
+    """
+    num_nodes = len(indptr) - 1
+    visited = np.zeros(num_nodes, dtype=np.bool_)
+    out_u = np.empty(len(nbrs), dtype=np.int64)
+    out_v = np.empty(len(nbrs), dtype=np.int64)
+    out_w = np.empty(len(nbrs), dtype=np.float64)
+    num_edges = 0
+
+    for start in range(num_nodes):
+        if not is_junction[start]:
+            continue
+        for s in range(indptr[start], indptr[start + 1]):
+            cur = nbrs[s]
+            total = weights[s]
+            if is_junction[cur]:
+                # Direct junction-to-junction edge; emit it from one end only
+                if start <= cur:
+                    out_u[num_edges] = start
+                    out_v[num_edges] = cur
+                    out_w[num_edges] = total
+                    num_edges += 1
+                continue
+            if visited[cur]:
+                # Chain already walked from its other end
+                continue
+
+            prev = start
+            closed = True
+            while not is_junction[cur]:
+                if visited[cur]:
+                    closed = False  # Looped back into this chain
+                    break
+                visited[cur] = True
+                # Step to the neighbor we did not come from
+                r = indptr[cur]
+                if nbrs[r] == prev:
+                    r += 1
+                prev = cur
+                total += weights[r]
+                cur = nbrs[r]
+            if closed:
+                out_u[num_edges] = start
+                out_v[num_edges] = cur
+                out_w[num_edges] = total
+                num_edges += 1
+
+    return out_u[:num_edges], out_v[:num_edges], out_w[:num_edges]
+
+@njit(cache=True)
+def _contract_passthrough_nodes(indptr, nbrs, weights, candidates, max_nodes):
+    """
+    Contracts degree-2 nodes of a symmetric CSR adjacency in place.
+
+    Each contracted node's two edges are replaced by a single edge between
+    its neighbors: the slots pointing at the node in both neighbors' rows are
+    rewritten to point at each other, or dropped (keeping the shorter weight)
+    if the neighbors are already connected. Dropped slots are marked with -1.
+    Candidates are processed as a worklist: a neighbor whose degree drops to 2
+    because of a contraction is queued as well, so chains that only become
+    contractible mid-way are still collapsed.
+
+    Args:
+        indptr: CSR row pointers
+        nbrs: CSR column indices, modified in place
+        weights: CSR edge weights, modified in place
+        candidates: Node indices to seed the worklist with, in order
+        max_nodes: Stop once this many nodes are left
+
+    Returns:
+        A (alive, nodes_removed) tuple, alive being a boolean mask over nodes.
+    """
+    num_nodes = len(indptr) - 1
+    alive = np.ones(num_nodes, dtype=np.bool_)
+    degree = np.empty(num_nodes, dtype=np.int32)
+    for i in range(num_nodes):
+        degree[i] = indptr[i + 1] - indptr[i]
+    num_alive = num_nodes
+    nodes_removed = 0
+
+    # FIFO worklist; a node is queued at most once, so num_nodes slots suffice
+    worklist = np.empty(num_nodes, dtype=np.int64)
+    in_worklist = np.zeros(num_nodes, dtype=np.bool_)
+    tail = 0
+    for node in candidates:
+        if not in_worklist[node]:
+            worklist[tail] = node
+            in_worklist[node] = True
+            tail += 1
+    head = 0
+
+    while head < tail and num_alive > max_nodes:
+        node = worklist[head]
+        head += 1
+        # Skip if the node was already removed or its degree is no longer 2
+        if not alive[node] or degree[node] != 2:
+            continue
+
+        # Find the node's two remaining edges
+        s1 = -1
+        s2 = -1
+        for s in range(indptr[node], indptr[node + 1]):
+            if nbrs[s] >= 0:
+                if s1 < 0:
+                    s1 = s
+                else:
+                    s2 = s
+        a = nbrs[s1]
+        b = nbrs[s2]
+        combined_weight = weights[s1] + weights[s2]
+        nbrs[s1] = -1
+        nbrs[s2] = -1
+
+        # Locate the slots for a->node and a->b (and the same from b)
+        sa_node = -1
+        sa_b = -1
+        for s in range(indptr[a], indptr[a + 1]):
+            if nbrs[s] == node:
+                sa_node = s
+            elif nbrs[s] == b:
+                sa_b = s
+        sb_node = -1
+        sb_a = -1
+        for s in range(indptr[b], indptr[b + 1]):
+            if nbrs[s] == node:
+                sb_node = s
+            elif nbrs[s] == a:
+                sb_a = s
+
+        if sa_b >= 0:
+            # Neighbors already connected: keep the shorter of the two routes
+            if combined_weight < weights[sa_b]:
+                weights[sa_b] = combined_weight
+                weights[sb_a] = combined_weight
+            nbrs[sa_node] = -1
+            nbrs[sb_node] = -1
+            degree[a] -= 1
+            degree[b] -= 1
+            # Either neighbor may have just become a pass-through node
+            if degree[a] == 2 and not in_worklist[a]:
+                worklist[tail] = a
+                in_worklist[a] = True
+                tail += 1
+            if degree[b] == 2 and not in_worklist[b]:
+                worklist[tail] = b
+                in_worklist[b] = True
+                tail += 1
+        else:
+            nbrs[sa_node] = b
+            weights[sa_node] = combined_weight
+            nbrs[sb_node] = a
+            weights[sb_node] = combined_weight
+
+        alive[node] = False
+        degree[node] = 0
+        num_alive -= 1
+        nodes_removed += 1
+
+    return alive, nodes_removed
+
+def simplify_graph(graph, junction_degree_threshold=3, max_nodes=500, verbose=True, inplace=False):
     """
     Simplifies a road network graph by:
     1. Keeping important junction nodes (with degree >= junction_degree_threshold)
@@ -70,72 +543,83 @@ def simplify_graph(graph, junction_degree_threshold=3, max_nodes=500, verbose=Tr
     4. Optionally limiting the total number of nodes
 
     Args:
-        graph: A networkx.MultiGraph representing the road network
+        graph: A networkx.Graph representing the road network
         junction_degree_threshold: Minimum degree to consider a node as junction (default=3)
         max_nodes: Maximum number of nodes to keep in the simplified graph (default=500)
-        verbose: Whether to print progress information
+        verbose: Whether to log the individual simplification steps (at DEBUG level)
+        inplace: Whether to simplify graph itself instead of a copy; use this
+                 when the original graph is not needed afterwards
 
     Returns:
-        A simplified networkx.MultiGraph
+        A simplified networkx.Graph (graph itself when inplace is True)
     """
     if graph is None:
-        print("Cannot simplify a None graph")
+        logger.error("Cannot simplify a None graph")
         return None
     
     if graph.number_of_nodes() <= max_nodes:
-        if verbose:
-            print(f"Graph already has {graph.number_of_nodes()} nodes, which is under the maximum of {max_nodes}. No simplification needed.")
-        return graph.copy()
+        logger.info("Graph already has %d nodes, which is under the maximum of %d. No simplification needed.", graph.number_of_nodes(), max_nodes)
+        return graph if inplace else graph.copy()
     
     start_time = time.time()
-    if verbose:
-        print(f"Simplifying graph from {graph.number_of_nodes()} nodes...")
+    original_num_nodes = graph.number_of_nodes()
+    logger.info("Simplifying graph from %d nodes...", graph.number_of_nodes())
     
-    # Create a copy to work with
-    simplified = graph.copy()
+    nodelist = list(graph.nodes())
+    degrees = np.fromiter((degree for _, degree in graph.degree(nodelist)), dtype=np.int64, count=len(nodelist))
     
     # Step 1: Identify key junction nodes (with many connections)
-    junction_nodes = [node for node, degree in simplified.degree() if degree >= junction_degree_threshold]
+    num_junctions = int(np.count_nonzero(degrees >= junction_degree_threshold))
     if verbose:
-        print(f"Found {len(junction_nodes)} junction nodes with degree >= {junction_degree_threshold}")
+        logger.debug("Found %d junction nodes with degree >= %d", num_junctions, junction_degree_threshold)
     
     # Step 2: Identify pass-through nodes (degree exactly 2)
-    passthrough_nodes = [node for node, degree in simplified.degree() if degree == 2]
+    passthrough_nodes = np.flatnonzero(degrees == 2)
     if verbose:
-        print(f"Found {len(passthrough_nodes)} pass-through nodes with degree = 2")
+        logger.debug("Found %d pass-through nodes with degree = 2", len(passthrough_nodes))
     
-    # Step 3: Remove pass-through nodes (contract edges)
-    # Start with nodes that have the lowest impact (simplest to remove)
-    nodes_removed = 0
+    # Step 3: Remove pass-through nodes (contract edges) in compiled loops
+    # over a CSR copy of the adjacency, until no degree-2 nodes are left
+    csr_graph = CSRGraph.from_networkx(graph, nodelist=nodelist)
+    is_junction = degrees != 2
+    if np.count_nonzero(is_junction) >= max_nodes:
+        # Every chain would be contracted anyway, so collapse them all in a
+        # single pass and keep contracting only what that leaves behind
+        u_arr, v_arr, w_arr = _collapse_chains(csr_graph.indptr, csr_graph.nbrs, csr_graph.weights.astype(np.float64), is_junction)
+        u_arr, v_arr, w_arr = _shortest_parallel_edges(u_arr, v_arr, w_arr)
+        not_loop = u_arr != v_arr
+        junctions = np.flatnonzero(is_junction)
+        junction_index = np.full(len(nodelist), -1, dtype=np.int64)
+        junction_index[junctions] = np.arange(len(junctions))
+        nodelist = [nodelist[i] for i in junctions.tolist()]
+        csr_graph = CSRGraph.from_edges(junction_index[u_arr[not_loop]], junction_index[v_arr[not_loop]], w_arr[not_loop], nodelist)
+        passthrough_nodes = np.flatnonzero(np.diff(csr_graph.indptr) == 2)
+        if verbose:
+            logger.debug("Collapsed chains of %d pass-through nodes. Graph now has %d nodes.", len(degrees) - len(nodelist), len(nodelist))
     
-    for i, node in enumerate(passthrough_nodes):
-        # Check if we've reached our target
-        if simplified.number_of_nodes() <= max_nodes:
-            break
-            
-        # Skip if the node was already removed in previous iterations
-        if node not in simplified:
-            continue
-            
-        # Get the neighbors before removing the node
-        neighbors = list(simplified.neighbors(node))
-        if len(neighbors) != 2:  # Skip if degree is no longer 2
-            continue
-            
-        # Calculate the combined weight of the edges we're replacing
-        # Correct way to get edge data from a MultiGraph
-        n1_weight = min(d.get('weight', 1.0) for u, v, d in simplified.edges(node, neighbors[0], data=True))
-        n2_weight = min(d.get('weight', 1.0) for u, v, d in simplified.edges(node, neighbors[1], data=True))
-        combined_weight = n1_weight + n2_weight
-        
-        # Remove the node and add a direct edge between its neighbors
-        simplified.add_edge(neighbors[0], neighbors[1], weight=combined_weight)
-        simplified.remove_node(node)
-        nodes_removed += 1
-        
-        # Show progress periodically
-        if verbose and (i+1) % 100 == 0:
-            print(f"Processed {i+1}/{len(passthrough_nodes)} pass-through nodes. Graph now has {simplified.number_of_nodes()} nodes.")
+    indptr = csr_graph.indptr.astype(np.int64)
+    nbrs = csr_graph.nbrs.astype(np.int64)
+    weights = csr_graph.weights.astype(np.float64)
+    alive, nodes_removed = _contract_passthrough_nodes(indptr, nbrs, weights, passthrough_nodes, max_nodes)
+    if verbose:
+        logger.debug("Contracted %d pass-through nodes. Graph now has %d nodes.", nodes_removed, int(alive.sum()))
+    
+    # Rebuild the reduced graph's edges once from the surviving CSR slots
+    rows = np.repeat(np.arange(len(nodelist)), np.diff(indptr))
+    keep = (nbrs >= 0) & (rows < nbrs)
+    kept_nodes = [nodelist[i] for i in np.flatnonzero(alive).tolist()]
+    if inplace:
+        simplified = graph
+        kept = set(kept_nodes)
+        simplified.remove_nodes_from([node for node in graph if node not in kept])
+        simplified.clear_edges()
+    else:
+        simplified = nx.Graph()
+        simplified.graph.update(graph.graph)
+        simplified.add_nodes_from((node, dict(graph.nodes[node])) for node in kept_nodes)
+    simplified.add_weighted_edges_from(
+        (nodelist[u], nodelist[v], w) for u, v, w in zip(rows[keep].tolist(), nbrs[keep].tolist(), weights[keep].tolist())
+    )
     
     # Step 4: If we still have too many nodes, remove low-importance nodes
     if simplified.number_of_nodes() > max_nodes:
@@ -146,7 +630,7 @@ def simplify_graph(graph, junction_degree_threshold=3, max_nodes=500, verbose=Tr
         nodes_to_remove = simplified.number_of_nodes() - max_nodes
         
         if verbose:
-            print(f"Still need to remove {nodes_to_remove} more nodes to reach target size of {max_nodes}")
+            logger.debug("Still need to remove %d more nodes to reach target size of %d", nodes_to_remove, max_nodes)
         
         # Remove nodes until we reach our target
         for i, (node, _) in enumerate(nodes_by_importance):
@@ -158,17 +642,18 @@ def simplify_graph(graph, junction_degree_threshold=3, max_nodes=500, verbose=Tr
     isolated_nodes = list(nx.isolates(simplified))
     if isolated_nodes:
         if verbose:
-            print(f"Removing {len(isolated_nodes)} isolated nodes")
+            logger.debug("Removing %d isolated nodes", len(isolated_nodes))
         simplified.remove_nodes_from(isolated_nodes)
     
+    logger.info("Graph simplification complete: %d nodes → %d nodes", original_num_nodes, simplified.number_of_nodes())
     if verbose:
-        print(f"Graph simplification complete: {graph.number_of_nodes()} nodes → {simplified.number_of_nodes()} nodes")
-        print(f"Simplification took {time.time() - start_time:.2f} seconds")
+        logger.debug("Simplification took %.2f seconds", time.time() - start_time)
     
     return simplified
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
     # Example Usage:
     # Assuming parsers.py is in the same directory or PYTHONPATH is set up
     # For direct testing, we might need to adjust import paths or run from project root
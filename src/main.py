@@ -1,102 +1,169 @@
 import os
 import sys
 import argparse
+import hashlib
+import pickle
+import tempfile
 import time
-from datetime import datetime
+import logging
+
+import numpy as np
+from sklearn.neighbors import BallTree
 
 # Import project modules
-from src.parsers import parse_gpx_file, parse_geojson_file
-from src.graph_utils import create_road_network_graph, simplify_graph
+from src.parsers import iter_gpx_segments, iter_geojson_segments
+from src.graph_utils import create_road_network_graph, simplify_graph, shortest_path_matrix
 from src.solvers.aco_solver import solve_route_with_aco
 from src.gpx_generator import convert_route_to_mapy_cz_compatible_gpx
+from src.geo_utils import EARTH_RADIUS_M
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever create_road_network_graph or simplify_graph change the graph
+# they produce, so graphs pickled by older code are not reused
+GRAPH_CACHE_VERSION = 2
+
+
+def _graph_cache_path(input_file, max_nodes, cache_dir):
+    """
+    Returns the cache file path for the graph built from input_file.
+
+    The key covers the file's path, modification time and size plus max_nodes
+    and GRAPH_CACHE_VERSION, so editing the input, changing the simplification
+    target or upgrading the graph code misses the cache.
+    """
+    stat = os.stat(input_file)
+    key = f"v{GRAPH_CACHE_VERSION}:{os.path.abspath(input_file)}:{stat.st_mtime_ns}:{stat.st_size}:{max_nodes}"
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f"graph_{digest}.pkl")
 
 
 def run(input_file, output_file=None, start_lat=None, start_lon=None, 
-        num_ants=10, num_iterations=100, resample_interval=50, max_nodes=500, verbose=False):
-    """Main function to orchestrate the route finding process."""
+        num_ants=10, num_iterations=100, resample_interval=50, max_nodes=500, verbose=False,
+        cache_dir='cache'):
+    """
+    Main function to orchestrate the route finding process.
+
+    Progress and results are reported through the module's logger
+    ("src.main"); callers using run() as a library configure logging
+    themselves, e.g. logging.basicConfig(level=logging.INFO). The
+    command-line entry point does this below.
+    """
     start_time = time.time()
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] ACO Route Finder - Starting...")
+    logger.info("ACO Route Finder - Starting...")
     
     # Set default output file if not provided
     if output_file is None:
         input_basename = os.path.splitext(os.path.basename(input_file))[0]
         output_file = os.path.join('output', f'{input_basename}_optimized.gpx')
     
-    # 1. Parse input file
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Parsing input file: {input_file}")
-    file_extension = os.path.splitext(input_file)[1].lower()
-    road_segments = []
-    
-    if file_extension == '.gpx':
-        road_segments = parse_gpx_file(input_file)
-    elif file_extension == '.geojson':
-        road_segments = parse_geojson_file(input_file)
-    else:
-        print(f"Error: Unsupported file format {file_extension}. Please provide .gpx or .geojson")
-        return
-    
-    if not road_segments:
-        print("Error: No road segments found in the input file.")
-        return
+    # Parsing, graph building and simplification only depend on the input file
+    # and max_nodes, so reuse a pickled result from an earlier run if there is one
+    graph = None
+    graph_cache_path = _graph_cache_path(input_file, max_nodes, cache_dir) if cache_dir and os.path.isfile(input_file) else None
+    if graph_cache_path and os.path.exists(graph_cache_path):
+        logger.info("Loading cached road network graph from %s", graph_cache_path)
+        try:
+            with open(graph_cache_path, 'rb') as f:
+                graph = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError, OSError, AttributeError) as e:
+            # Truncated or unreadable cache file; rebuild and overwrite it
+            logger.warning("Could not load cached graph (%s); rebuilding it.", e)
+            graph = None
+        else:
+            logger.info("Cached graph has %s nodes and %s edges.", graph.number_of_nodes(), graph.number_of_edges())
+    
+    if graph is None:
+        # 1-2. Parse the input file and build the road network graph, feeding
+        # segments to the graph builder as the parser produces them
+        logger.info("Parsing input file and building road network graph: %s", input_file)
+        file_extension = os.path.splitext(input_file)[1].lower()
+    
+        if file_extension == '.gpx':
+            road_segments = iter_gpx_segments(input_file)
+        elif file_extension == '.geojson':
+            road_segments = iter_geojson_segments(input_file)
+        else:
+            logger.error("Error: Unsupported file format %s. Please provide .gpx or .geojson", file_extension)
+            return
+    
+        try:
+            graph = create_road_network_graph(road_segments)
+        except Exception as e:
+            logger.error("Error parsing input file %s: %s", input_file, e)
+            return
+    
+        if graph is None:
+            logger.error("Error: No road segments found in the input file.")
+            return
         
-    print(f"Successfully parsed {len(road_segments)} road segments from input file.")
-    
-    # 2. Build graph
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Building road network graph...")
-    graph = create_road_network_graph(road_segments)
-    print(f"Road network graph created with {graph.number_of_nodes()} nodes and {graph.number_of_edges()} edges.")
-    
-    # 2a. Simplify the graph if it's too large
-    if graph.number_of_nodes() > max_nodes:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Graph is too large ({graph.number_of_nodes()} nodes). Simplifying to approximately {max_nodes} nodes...")
-        graph = simplify_graph(graph, max_nodes=max_nodes)
-        print(f"Simplified graph now has {graph.number_of_nodes()} nodes and {graph.number_of_edges()} edges.")
+        logger.info("Road network graph created with %s nodes and %s edges.", graph.number_of_nodes(), graph.number_of_edges())
+    
+        # 2a. Simplify the graph if it's too large
+        if graph.number_of_nodes() > max_nodes:
+            logger.info("Graph is too large (%s nodes). Simplifying to approximately %s nodes...", graph.number_of_nodes(), max_nodes)
+            graph = simplify_graph(graph, max_nodes=max_nodes, verbose=verbose, inplace=True)
+            logger.info("Simplified graph now has %s nodes and %s edges.", graph.number_of_nodes(), graph.number_of_edges())
+    
+        if graph_cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file and move it into place, so an
+            # interrupted dump never leaves a truncated file under the real key
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='graph_', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, graph_cache_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            logger.info("Cached road network graph to %s", graph_cache_path)
+    
+    # Fix the node ordering once; integer node indices (start node, distance
+    # matrix rows, solver tour) all refer to positions in this list
+    node_list = sorted(graph.nodes())
     
     # Find starting node if coordinates are provided
     start_node_index = None
     if start_lat is not None and start_lon is not None:
-        print(f"Finding closest node to starting coordinates: ({start_lat}, {start_lon})")
-        start_point = (start_lat, start_lon)
-        
-        # Import here to avoid circular dependencies
-        from geopy.distance import geodesic
-        
-        # Find the closest node in the graph to the given coordinates
-        min_distance = float('inf')
-        closest_node = None
+        logger.info("Finding closest node to starting coordinates: (%s, %s)", start_lat, start_lon)
         
-        for node in graph.nodes():
-            distance = geodesic(start_point, node).meters
-            if distance < min_distance:
-                min_distance = distance
-                closest_node = node
-        
-        # Need to get the index of this node in a sorted list (for the ACO solver)
-        if closest_node is not None:
-            node_list = sorted(list(graph.nodes()))
-            try:
-                start_node_index = node_list.index(closest_node)
-                print(f"Found closest node {closest_node} at index {start_node_index} (distance: {min_distance:.2f}m)")
-            except ValueError:
-                print(f"Warning: Could not find index of closest node {closest_node}. Using random start.")
-    
-    # 3. Run ACO solver
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Running ACO solver with {num_ants} ants and {num_iterations} iterations...")
+        # Find the closest node in the graph to the given coordinates with a
+        # haversine BallTree over the node positions; the tree index is the
+        # node's position in node_list
+        if node_list:
+            positions = graph.graph['coords'][np.asarray(node_list, dtype=np.int64)]
+            tree = BallTree(np.deg2rad(positions), metric='haversine')
+            dist, idx = tree.query(np.deg2rad([[start_lat, start_lon]]), k=1)
+            start_node_index = int(idx[0, 0])
+            closest_node = node_list[start_node_index]
+            min_distance = float(dist[0, 0]) * EARTH_RADIUS_M
+            logger.info("Found closest node %s %s at index %s (distance: %.2fm)",
+                        closest_node, graph.nodes[closest_node]['pos'], start_node_index, min_distance)
+    
+    # 3. Precompute (or load cached) shortest-path distances between all nodes
+    logger.info("Preparing shortest-path distance matrix...")
+    distance_matrix = shortest_path_matrix(graph, nodelist=node_list, cache_dir=cache_dir)
+    
+    # 4. Run ACO solver
+    logger.info("Running ACO solver with %s ants and %s iterations...", num_ants, num_iterations)
     optimized_route = solve_route_with_aco(
         graph, 
         num_ants=num_ants, 
         num_iterations=num_iterations, 
-        start_node_index=start_node_index
+        start_node_index=start_node_index,
+        distance_matrix=distance_matrix,
+        node_list=node_list
     )
     
     if not optimized_route:
-        print("Error: ACO solver failed to find a route.")
+        logger.error("Error: ACO solver failed to find a route.")
         return
         
-    print(f"ACO solver found optimized route with {len(optimized_route)} points.")
+    logger.info("ACO solver found optimized route with %s points.", len(optimized_route))
     
-    # 4. Generate output GPX
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Generating output GPX file...")
+    # 5. Generate output GPX
+    logger.info("Generating output GPX file...")
     
     route_name = f"Optimized route for {os.path.basename(input_file)}"
     route_description = f"Route optimized using Ant Colony Optimization with {num_ants} ants and {num_iterations} iterations."
@@ -113,14 +180,14 @@ def run(input_file, output_file=None, start_lat=None, start_lon=None,
     end_time = time.time()
     total_time = end_time - start_time
     
-    print(f"\n--- Route Optimization Completed ---")
-    print(f"Input file: {input_file}")
-    print(f"Output file: {output_stats['output_file']}")
-    print(f"Route length: {output_stats['total_distance_km']:.2f} km")
-    print(f"Original points: {output_stats['original_point_count']}")
-    print(f"Output points: {output_stats['output_point_count']}")
-    print(f"Processing time: {total_time:.2f} seconds")
-    print(f"\nYou can open the output file in Mapy.cz or other GPX-compatible navigation apps.")
+    logger.info("--- Route Optimization Completed ---")
+    logger.info("Input file: %s", input_file)
+    logger.info("Output file: %s", output_stats['output_file'])
+    logger.info("Route length: %.2f km", output_stats['total_distance_km'])
+    logger.info("Original points: %s", output_stats['original_point_count'])
+    logger.info("Output points: %s", output_stats['output_point_count'])
+    logger.info("Processing time: %.2f seconds", total_time)
+    logger.info("You can open the output file in Mapy.cz or other GPX-compatible navigation apps.")
 
 
 def parse_arguments():
@@ -135,6 +202,7 @@ def parse_arguments():
     parser.add_argument('--iterations', type=int, default=100, help='Number of iterations for ACO (default: 100)')
     parser.add_argument('--resample', type=int, default=50, help='Resample interval in meters (default: 50, 0 to disable)')
     parser.add_argument('--max-nodes', type=int, default=500, help='Maximum number of nodes in simplified graph (default: 500)')
+    parser.add_argument('--cache-dir', default='cache', help='Directory for cached road network graphs and shortest-path distances (default: ./cache, empty to disable)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
     
     return parser.parse_args()
@@ -142,6 +210,12 @@ def parse_arguments():
 
 if __name__ == "__main__":
     args = parse_arguments()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='[%(asctime)s] %(message)s',
+        datefmt='%H:%M:%S',
+        stream=sys.stdout
+    )
     run(
         input_file=args.input_file,
         output_file=args.output_file,
@@ -151,5 +225,6 @@ if __name__ == "__main__":
         num_iterations=args.iterations,
         resample_interval=args.resample,
         max_nodes=args.max_nodes,
-        verbose=args.verbose
+        verbose=args.verbose,
+        cache_dir=args.cache_dir
     )
@@ -1,78 +1,126 @@
-import gpxpy
-import gpxpy.gpx
-import geojson
+import logging
+import mmap
 import os
 
+import ijson
+import numpy as np
+import orjson
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+def _points_to_array(points):
+    """Packs a list of (lat, lon) floats into an (n, 2) float64 array."""
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+def iter_gpx_segments(file_path):
+    """
+    Yields the road segments (track segments and routes) of a GPX file one at a time.
+    The file is streamed with lxml's iterparse, so only the segment currently
+    being read is held in memory. Both GPX 1.0 and 1.1 namespaces are accepted.
+    Each segment is an (n, 2) float64 array of (lat, lon) rows, in document order.
+    Parse errors are raised to the caller.
+    """
+    points = []
+    # Parse straight from the OS page cache instead of buffering the file
+    with open(file_path, 'rb') as gpx_file, mmap.mmap(gpx_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for _, element in etree.iterparse(
+            mapped, events=('end',),
+            tag=('{*}trkpt', '{*}rtept', '{*}trkseg', '{*}rte'),
+        ):
+            if etree.QName(element).localname in ('trkpt', 'rtept'):
+                points.append((float(element.get('lat')), float(element.get('lon'))))
+            elif points:
+                # End of a track segment or route: hand over its points
+                yield _points_to_array(points)
+                points = []
+            # Free the parsed element and any siblings already handled
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
 def parse_gpx_file(file_path):
     """
     Parses a GPX file and extracts road segments (tracks/routes).
-    Returns a list of segments, where each segment is a list of (lat, lon) tuples.
+    Returns a list of segments, where each segment is an (n, 2) float64 array of (lat, lon) rows.
     """
-    segments = []
     try:
-        with open(file_path, 'r', encoding='utf-8') as gpx_file:
-            gpx = gpxpy.parse(gpx_file)
-
-        # Extract points from tracks and their segments
-        for track in gpx.tracks:
-            for segment in track.segments:
-                segment_points = []
-                for point in segment.points:
-                    segment_points.append((point.latitude, point.longitude))
-                if segment_points:
-                    segments.append(segment_points)
-        
-        # Extract points from routes
-        for route in gpx.routes:
-            route_points = []
-            for point in route.points:
-                route_points.append((point.latitude, point.longitude))
-            if route_points:
-                segments.append(route_points)
-                
+        segments = list(iter_gpx_segments(file_path))
     except Exception as e:
-        print(f"Error parsing GPX file {file_path}: {e}")
+        logger.error("Error parsing GPX file %s: %s", file_path, e)
         return None
     
     if not segments:
-        print(f"No track/route segments found in GPX file: {file_path}")
+        logger.warning("No track/route segments found in GPX file: %s", file_path)
         return None
         
     return segments
 
-def parse_geojson_file(file_path):
+def _linestring_to_array(coordinates):
     """
-    Parses a GeoJSON file and extracts road segments (LineStrings).
+    Converts GeoJSON (lon, lat[, ele]) positions into an (n, 2) array of (lat, lon) rows.
+    Returns None for an empty or malformed LineString.
+    """
+    if not coordinates:
+        return None
+    try:
+        positions = np.asarray(coordinates, dtype=np.float64)
+    except ValueError:
+        # Ragged: the LineString mixes 2D and 3D positions
+        positions = None
+    if positions is not None and positions.ndim == 2 and positions.shape[1] >= 2:
+        return positions[:, [1, 0]]
+    try:
+        return np.fromiter(((p[1], p[0]) for p in coordinates),
+                           dtype=np.dtype((np.float64, 2)), count=len(coordinates))
+    except (IndexError, TypeError, ValueError):
+        logger.warning("Skipping LineString with malformed coordinates: %.80s", coordinates)
+        return None
+
+def iter_geojson_segments(file_path):
+    """
+    Yields the road segments (LineStrings) of a GeoJSON file one at a time.
     Assumes features of type 'LineString' represent road segments.
-    Returns a list of segments, where each segment is a list of (lat, lon) tuples.
+    FeatureCollections are streamed feature by feature with ijson; a file
+    holding a single bare LineString is small and is loaded whole.
+    Each segment is an (n, 2) float64 array of (lat, lon) rows.
     Note: GeoJSON coordinates are typically (lon, lat). We'll convert to (lat, lon).
+    Parse errors are raised to the caller.
     """
-    segments = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = geojson.load(f)
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        has_features = False
+        for feature in ijson.items(mapped, 'features.item', use_float=True):
+            has_features = True
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'LineString':
+                # GeoJSON coordinates are (longitude, latitude)
+                # We convert to (latitude, longitude) for consistency
+                segment_points = _linestring_to_array(geometry.get('coordinates'))
+                if segment_points is not None:
+                    yield segment_points
+            # TODO: Handle MultiLineString if necessary
         
-        if data.get('type') == 'FeatureCollection':
-            for feature in data.get('features', []):
-                geometry = feature.get('geometry', {})
-                if geometry.get('type') == 'LineString':
-                    # GeoJSON coordinates are (longitude, latitude)
-                    # We convert to (latitude, longitude) for consistency
-                    segment_points = [(coord[1], coord[0]) for coord in geometry.get('coordinates', [])]
-                    if segment_points:
-                        segments.append(segment_points)
-                # TODO: Handle MultiLineString if necessary
-        elif data.get('type') == 'LineString': # A single LineString feature
-            segment_points = [(coord[1], coord[0]) for coord in data.get('coordinates', [])]
-            if segment_points:
-                segments.append(segment_points)
+        if not has_features:
+            with memoryview(mapped) as view:
+                data = orjson.loads(view)
+            if data.get('type') == 'LineString': # A single LineString feature
+                segment_points = _linestring_to_array(data.get('coordinates'))
+                if segment_points is not None:
+                    yield segment_points
 
+def parse_geojson_file(file_path):
+    """
+    Parses a GeoJSON file and extracts road segments (LineStrings).
+    Returns a list of segments, where each segment is an (n, 2) float64 array of (lat, lon) rows.
+    """
+    try:
+        segments = list(iter_geojson_segments(file_path))
     except Exception as e:
-        print(f"Error parsing GeoJSON file {file_path}: {e}")
+        logger.error("Error parsing GeoJSON file %s: %s", file_path, e)
         return None
 
     if not segments:
-        print(f"No LineString features found in GeoJSON file: {file_path}")
+        logger.warning("No LineString features found in GeoJSON file: %s", file_path)
         return None
         
     return segments
@@ -85,17 +133,18 @@ def load_road_network_data(file_path):
     """
     _, file_extension = os.path.splitext(file_path)
     
-    print(f"Loading road network data from: {file_path}")
+    logger.info("Loading road network data from: %s", file_path)
 
     if file_extension.lower() == '.gpx':
         return parse_gpx_file(file_path)
     elif file_extension.lower() == '.geojson':
         return parse_geojson_file(file_path)
     else:
-        print(f"Unsupported file type: {file_extension}. Please use .gpx or .geojson.")
+        logger.error("Unsupported file type: %s. Please use .gpx or .geojson.", file_extension)
         return None
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
     # Example usage (assuming you have test files in input_data)
     # Create dummy files for testing if they don't exist
     
@@ -1,27 +1,47 @@
 import networkx as nx
-import pants  # aco-pants package is imported as 'pants' module
+import numpy as np
 import random
+import logging
 import time
 import sys
 from geopy.distance import geodesic
+from src.graph_utils import shortest_path_matrix
+
+# The Numba kernels are the solver; the pure-Python aco-pants package is only
+# an optional fallback for environments without Numba
+try:
+    from src.solvers.aco_solver_np import aco_iterate, nearest_neighbour_tour, candidate_lists, heuristic_table, table_power, update_pheromone
+except ImportError:
+    aco_iterate = None
+
+try:
+    import pants  # aco-pants package is imported as 'pants' module
+except ImportError:
+    pants = None
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL_S = 0.1  # Minimum time between progress bar redraws
 
 def display_progress(iteration, total, prefix='', suffix='', length=50, fill='█'):    
     percent = iteration / total
     filled_length = int(length * iteration // total)
     bar = fill * filled_length + '-' * (length - filled_length)
-    sys.stdout.write('\r%s |%s| %3d%% %s' % (prefix, bar, int(100 * percent), suffix))
+    # Clear to end of line: the suffix can be shorter than the previous one
+    sys.stdout.write('\r%s |%s| %3d%% %s\033[K' % (prefix, bar, int(100 * percent), suffix))
     sys.stdout.flush()
     if iteration == total:
         print()
 
 
-def solve_route_with_aco(graph, num_ants=10, num_iterations=100, alpha=1.0, beta=3.0, evaporation_rate=0.8, start_node_index=None, show_progress=True):
+def solve_route_with_aco(graph, num_ants=10, num_iterations=100, alpha=1.0, beta=3.0, evaporation_rate=0.8, start_node_index=None, show_progress=True, distance_matrix=None, node_list=None, warmup_iters=3, candidate_list_size=None):
     """
     Finds a route visiting all nodes in the graph using Ant Colony Optimization (TSP variant).
 
     Args:
-        graph (nx.MultiGraph): The road network graph. Nodes are (lat, lon) tuples.
-                               Edges must have a 'weight' attribute (length).
+        graph (nx.Graph): The road network graph. Nodes must have a 'pos' attribute
+                          holding their (lat, lon) coordinates.
+                          Edges must have a 'weight' attribute (length).
         num_ants (int): Number of ants to use in each iteration.
         num_iterations (int): Number of iterations for the ACO algorithm (limit parameter).
         alpha (float): Pheromone influence factor (default=1.0).
@@ -29,164 +49,227 @@ def solve_route_with_aco(graph, num_ants=10, num_iterations=100, alpha=1.0, beta
         evaporation_rate (float): Rate at which pheromone evaporates (rho parameter, default=0.8).
         start_node_index (int, optional): The index of the node to start the tour from. 
                                           If None, a random start node is chosen.
+        show_progress (bool): Whether to display a progress bar while iterating
+            (on a terminal; otherwise improvements are logged at DEBUG level).
+        distance_matrix (np.ndarray, optional): Precomputed shortest-path distances where
+                                                entry [i, j] is the distance between nodes i and j
+                                                in node_list order (see graph_utils.shortest_path_matrix).
+                                                If None, the matrix is computed here.
+        node_list (list, optional): The node ordering that integer indices (start_node_index,
+                                    distance_matrix rows) refer to. Defaults to graph.nodes() order.
+        warmup_iters (int): Number of initial iterations in which every ant follows the greedy
+                            nearest-neighbour tour instead of the roulette, seeding the pheromone
+                            before the regular ACO iterations (default=3).
+        candidate_list_size (int, optional): Number of nearest nodes an ant chooses among at each
+                                             step; it only considers the remaining nodes once all
+                                             of them are visited. Defaults to min(20, N - 1); other
+                                             values are clamped to the range 1..N - 1.
 
     Returns:
         A list of (lat, lon) coordinates representing the optimized tour, or None if failed.
     """
-    if not graph or graph.number_of_nodes() < 2:
-        print("Graph is too small or empty for ACO.")
+    if graph is None or graph.number_of_nodes() < 2:
+        logger.error("Graph is too small or empty for ACO.")
         return None
 
-    # pants works with integer-indexed nodes. Create a mapping.
-    node_list = list(graph.nodes())
-    node_to_int = {node: i for i, node in enumerate(node_list)}
-    int_to_node = {i: node for i, node in enumerate(node_list)}
+    if num_ants < 1 or num_iterations < 1:
+        logger.error("Invalid ACO parameters: num_ants=%s, num_iterations=%s. Both must be at least 1.", num_ants, num_iterations)
+        return None
+
+    # The solver works with integer-indexed nodes; index i is node_list[i]
+    if node_list is None:
+        node_list = list(graph.nodes())
     
     num_nodes = len(node_list)
 
-    # Define the distance callback for pants (lfunc parameter)
-    memoized_distances = {}
-    def distance_callback(start_int, end_int):
-        if (start_int, end_int) in memoized_distances:
-            return memoized_distances[(start_int, end_int)]
-        if (end_int, start_int) in memoized_distances: # Distances are symmetric for undirected paths
-            return memoized_distances[(end_int, start_int)]
+    missing_pos = [node for node in node_list if 'pos' not in graph.nodes.get(node, {})]
+    if missing_pos:
+        logger.error("%d node(s) are missing from the graph or have no 'pos' attribute (e.g. %r).", len(missing_pos), missing_pos[0])
+        return None
 
-        start_coord = int_to_node[start_int]
-        end_coord = int_to_node[end_int]
-        
-        if start_coord == end_coord:
-            return 0.0
-        
+    # All-pairs shortest-path distances, computed once up front; unreachable
+    # pairs are inf
+    if distance_matrix is None:
         try:
-            # Use NetworkX to find the shortest path length
-            length = nx.shortest_path_length(graph, source=start_coord, target=end_coord, weight='weight')
-            memoized_distances[(start_int, end_int)] = length
-            return length
-        except nx.NetworkXNoPath:
-            print(f"Warning: No path between {start_coord} and {end_coord}. Using large distance.")
-            return float('inf')
-        except Exception as e:
-            print(f"Error calculating distance between {start_coord} and {end_coord}: {e}")
-            return float('inf')
+            distance_matrix = shortest_path_matrix(graph, nodelist=node_list, cache_dir=None)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error("Could not compute shortest-path distances for ACO: %s", e)
+            return None
+    elif np.shape(distance_matrix) != (num_nodes, num_nodes):
+        logger.error("Distance matrix has shape %s, expected (%d, %d).", np.shape(distance_matrix), num_nodes, num_nodes)
+        return None
+    dist = distance_matrix
 
-    print(f"Starting ACO for {num_nodes} nodes with {num_ants} ants and {num_iterations} iterations.")
+    # Any unreachable pair (off the zero diagonal) means the graph is
+    # disconnected and every tour is infinite; do not run the colony at all
+    unreachable = np.isinf(dist).any(axis=1)
+    if unreachable.any():
+        logger.error("Graph is disconnected: %d of %d node(s) cannot reach every other node. Cannot build a tour.", int(unreachable.sum()), num_nodes)
+        return None
+
+    # Define the distance callback for the pants fallback (lfunc parameter)
+    def distance_callback(start_int, end_int):
+        return float(dist[start_int, end_int])
+
+    logger.info("Starting ACO for %d nodes with %d ants and %d iterations.", num_nodes, num_ants, num_iterations)
 
-    # Create world with nodes and length function
-    world = pants.World(list(range(num_nodes)), lfunc=distance_callback)
-    
     if start_node_index is None:
-        effective_start_node_idx = random.choice(list(range(num_nodes)))
+        effective_start_node_idx = random.randrange(num_nodes)
     elif 0 <= start_node_index < num_nodes:
         effective_start_node_idx = start_node_index
     else:
-        print(f"Warning: Invalid start_node_index {start_node_index}. Choosing randomly.")
-        effective_start_node_idx = random.choice(list(range(num_nodes)))
-    
-    print(f"ACO starting node (integer index): {effective_start_node_idx} (corresponds to {int_to_node[effective_start_node_idx]}) ")
-
-    # Create solver with our parameters
-    solver = pants.Solver(
-        alpha=alpha,
-        beta=beta,
-        rho=evaporation_rate,
-        limit=num_iterations,
-        ant_count=num_ants
-    )
+        logger.warning("Invalid start_node_index %s. Choosing randomly.", start_node_index)
+        effective_start_node_idx = random.randrange(num_nodes)
     
-    try:
-        # Instead of directly calling solver.solve(world), we'll handle iterations manually
-        # to display progress
-        if show_progress:
-            print(f"\nStarting ACO iterations:")
-            
-            # Create a colony to work with
-            colony = pants.Colony(world)
+    logger.info("ACO starting node (integer index): %d (corresponds to %r)", effective_start_node_idx, node_list[effective_start_node_idx])
+
+    if aco_iterate is None and pants is None:
+        logger.error("Neither numba nor aco-pants is installed; cannot run ACO.")
+        return None
+
+    if aco_iterate is not None:
+        # Only draw the bar on a terminal; when stdout is redirected, log
+        # progress lines at DEBUG level instead
+        interactive = show_progress and sys.stdout.isatty()
+        if interactive:
+            print("\nStarting ACO iterations:")
+        clear_line = "\r\033[K" if interactive else ""
+        
+        # Pheromone and heuristic tables for the compiled tour builder;
+        # the heuristic term never changes, so raise it to beta once
+        pheromone = np.ones((num_nodes, num_nodes), dtype=np.float32)
+        eta_beta = heuristic_table(dist, beta)
+        
+        # Each ant step only weighs the current node's nearest neighbours
+        if candidate_list_size is None:
+            candidate_list_size = min(20, num_nodes - 1)
+        else:
+            candidate_list_size = max(1, min(candidate_list_size, num_nodes - 1))
+        candidates = candidate_lists(dist, candidate_list_size)
             
-            # Configure ants
-            for ant in colony.get_ants():
-                ant.initialize(alpha=alpha, beta=beta)
-                
-            # Track the best solution
-            best_tour_indices = None
-            best_tour_distance = float('inf')
-            last_improvement = 0
+        # Track the best solution
+        best_tour_indices = None
+        best_tour_distance = float('inf')
+        last_improvement = 0
+        
+        # Warm-up tours are deterministic, so build the nearest-neighbour
+        # tour once and let every ant reuse it during the warm-up
+        if warmup_iters > 0:
+            nn_tour, nn_length = nearest_neighbour_tour(dist, effective_start_node_idx)
+            warmup_tours = np.tile(nn_tour, (num_ants, 1))
+            warmup_lengths = np.full(num_ants, nn_length)
             
-            # Run the iterations with progress display
-            start_time = time.time()
-            for i in range(num_iterations):
-                # Update progress bar
-                elapsed = time.time() - start_time
-                eta = (elapsed / (i+1)) * (num_iterations - i - 1) if i > 0 else 0
+        # Run the iterations, with progress display if requested
+        start_time = time.perf_counter()
+        last_render = -PROGRESS_INTERVAL_S
+        pending_msg = ""
+        for i in range(num_iterations):
+            # Update progress bar, at most every PROGRESS_INTERVAL_S seconds,
+            # showing any improvement found since the last redraw
+            now = time.perf_counter()
+            if interactive and (now - last_render >= PROGRESS_INTERVAL_S or i == num_iterations - 1):
+                last_render = now
+                elapsed = now - start_time
+                eta = (elapsed / i) * (num_iterations - i) if i > 0 else 0
                 suffix = f"[ETA: {eta:.1f}s]" if eta > 0 else ""
-                if i % 2 == 0:  # Update every other iteration to reduce flicker
-                    display_progress(i+1, num_iterations, 
-                                    prefix=f"Iteration {i+1}/{num_iterations}", 
-                                    suffix=suffix)
-                
-                # Run a single iteration
-                colony.make_tours()
-                colony.pheromone_changes()
-                colony.spread_pheromone(rho=evaporation_rate)
-                
-                # Check if we have a better solution
-                for ant in colony.get_ants():
-                    if ant.distance < best_tour_distance:
-                        best_tour_distance = ant.distance
-                        best_tour_indices = ant.tour
-                        last_improvement = i
-                        if show_progress:
-                            print(f"\r\033[KFound better tour at iteration {i+1}: {best_tour_distance:.2f} meters")
-                            # Redraw progress bar
-                            display_progress(i+1, num_iterations, 
-                                        prefix=f"Iteration {i+1}/{num_iterations}", 
-                                        suffix=suffix)
-                
-                # Early stopping if no improvement for a while
-                if i - last_improvement > num_iterations // 5 and i > num_iterations // 2:
-                    print(f"\r\033[KStopping early at iteration {i+1}/{num_iterations} - No improvement for {i - last_improvement} iterations")
-                    break
+                if pending_msg:
+                    suffix = f"{suffix} {pending_msg}".lstrip()
+                    pending_msg = ""
+                display_progress(i+1, num_iterations, 
+                                prefix=f"Iteration {i+1}/{num_iterations}", 
+                                suffix=suffix)
             
-            # Ensure we show 100% at the end
-            if show_progress:
-                display_progress(num_iterations, num_iterations, 
-                               prefix=f"Iteration {num_iterations}/{num_iterations}", 
-                               suffix="[Complete]")
-                print(f"\nFinal tour distance: {best_tour_distance:.2f} meters")
-        else:
-            # If not showing progress, just use the standard solve method
-            solution = solver.solve(world)
-
-            if hasattr(solution, 'tour'):
-                best_tour_indices = solution.tour
+            # Run a single iteration: build all tours from this iteration's
+            # attractiveness, then evaporate and deposit pheromone
+            if i < warmup_iters:
+                tours, lengths = warmup_tours, warmup_lengths
             else:
-                print("Solution doesn't have 'tour' attribute. Using solution directly.")
-                best_tour_indices = solution
-
-        if not best_tour_indices:
-            print("ACO did not return a valid tour.")
-            return None
+                attractiveness = table_power(pheromone, alpha) * eta_beta
+                tours, lengths = aco_iterate(dist, attractiveness, candidates, num_ants, effective_start_node_idx)
+            update_pheromone(pheromone, tours, lengths, evaporation_rate)
             
-        if best_tour_indices[0] != best_tour_indices[-1]:
-             best_tour_indices.append(best_tour_indices[0])
-
-        optimized_route_coords = [int_to_node[idx] for idx in best_tour_indices]
-        
-        total_distance = 0
-        for i in range(len(best_tour_indices) - 1):
-            total_distance += distance_callback(best_tour_indices[i], best_tour_indices[i+1])
+            # Check if this iteration's best ant beat the best solution
+            best_ant = int(lengths.argmin())
+            iteration_best = lengths[best_ant]
+            if iteration_best < best_tour_distance:
+                best_tour_distance = float(iteration_best)
+                best_tour_indices = tours[best_ant, :-1].copy()
+                last_improvement = i
+                if interactive:
+                    # Shown with the next scheduled redraw instead of
+                    # printing a line and re-rendering the bar right away
+                    pending_msg = f"[best at iter {i+1}: {best_tour_distance:.2f}m]"
+                elif show_progress:
+                    logger.debug("Found better tour at iteration %d: %.2f meters", i + 1, best_tour_distance)
+            
+            # Stop as soon as the colony has converged: at least 40% of the
+            # ants found a tour as short as the best one so far. Warm-up
+            # ants all share one tour, so only count regular iterations
+            converged = np.mean(np.isclose(lengths, iteration_best, rtol=1e-9))
+            if i > warmup_iters and converged >= 0.4 and iteration_best <= best_tour_distance:
+                if interactive:
+                    sys.stdout.write(clear_line)
+                logger.info("Stopping early at iteration %d/%d - Converged (%.0f%% of ants on the best tour)", i + 1, num_iterations, converged * 100)
+                break
+            
+            # Early stopping if no improvement for a while
+            if i - last_improvement > num_iterations // 5 and i > num_iterations // 2:
+                if interactive:
+                    sys.stdout.write(clear_line)
+                logger.info("Stopping early at iteration %d/%d - No improvement for %d iterations", i + 1, num_iterations, i - last_improvement)
+                break
         
-        print(f"ACO finished. Best tour length: {total_distance:.2f} meters.")
-        print(f"Tour path (node indices): {best_tour_indices}")
-        return optimized_route_coords
-
-    except Exception as e:
-        print(f"An error occurred during ACO solving: {e}")
-        import traceback
-        traceback.print_exc()
+        # Ensure we show 100% at the end
+        if interactive:
+            display_progress(num_iterations, num_iterations, 
+                           prefix=f"Iteration {num_iterations}/{num_iterations}", 
+                           suffix="[Complete]")
+            print()
+    else:
+        # Fallback without Numba: pants' standard solve method
+        world = pants.World(list(range(num_nodes)), lfunc=distance_callback)
+        solver = pants.Solver(
+            alpha=alpha,
+            beta=beta,
+            rho=evaporation_rate,
+            limit=num_iterations,
+            ant_count=num_ants
+        )
+        # pants' API has changed between releases; report its failures
+        # instead of crashing the caller
+        try:
+            solution = solver.solve(world)
+        except Exception as e:
+            logger.error("An error occurred during ACO solving: %s", e)
+            return None
+
+        if hasattr(solution, 'tour'):
+            best_tour_indices = np.asarray(solution.tour, dtype=np.int64)
+        else:
+            logger.warning("Solution doesn't have 'tour' attribute. Using solution directly.")
+            best_tour_indices = np.asarray(solution, dtype=np.int64)
+
+    if best_tour_indices is None or len(best_tour_indices) == 0:
+        logger.error("ACO did not return a valid tour.")
         return None
+        
+    if best_tour_indices[0] != best_tour_indices[-1]:
+        best_tour_indices = np.r_[best_tour_indices, best_tour_indices[0]]
+
+    # Object array of positions so the whole tour maps to coords in one fancy-index
+    node_positions = np.fromiter((graph.nodes[node]['pos'] for node in node_list),
+                                 dtype=object, count=num_nodes)
+    optimized_route_coords = list(node_positions[best_tour_indices])
+    
+    total_distance = float(dist[best_tour_indices[:-1], best_tour_indices[1:]].sum())
+    
+    logger.info("ACO finished. Best tour length: %.2f meters.", total_distance)
+    logger.debug("Tour path (node indices): %s", best_tour_indices.tolist())
+    return optimized_route_coords
+
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
     # Example usage:
     # Create a sample graph (e.g., from graph_utils.py's test data or a small manual one)
     
@@ -195,20 +278,22 @@ if __name__ == '__main__':
     # ensure Python can find graph_utils (e.g., by being in the project root and running `python -m src.solvers.aco_solver`)
     # For simplicity in direct execution of this file, let's redefine a tiny graph here.
 
-    test_graph = nx.MultiGraph()
-    # A simple connected graph with lat/lon coordinates as nodes
+    test_graph = nx.Graph()
+    # A simple connected graph with integer nodes carrying lat/lon positions
     test_nodes_coords = {
         0: (50.0, 19.0), 
         1: (50.01, 19.01), 
         2: (50.02, 19.02),
         3: (50.00, 19.02) # Another node to make it slightly more complex
     }
+    for node_id, pos in test_nodes_coords.items():
+        test_graph.add_node(node_id, pos=pos)
     
-    test_graph.add_edge(test_nodes_coords[0], test_nodes_coords[1], weight=geodesic(test_nodes_coords[0], test_nodes_coords[1]).meters)
-    test_graph.add_edge(test_nodes_coords[1], test_nodes_coords[2], weight=geodesic(test_nodes_coords[1], test_nodes_coords[2]).meters)
-    test_graph.add_edge(test_nodes_coords[2], test_nodes_coords[0], weight=geodesic(test_nodes_coords[2], test_nodes_coords[0]).meters) # Makes a 3-cycle
-    test_graph.add_edge(test_nodes_coords[0], test_nodes_coords[3], weight=geodesic(test_nodes_coords[0], test_nodes_coords[3]).meters)
-    test_graph.add_edge(test_nodes_coords[3], test_nodes_coords[2], weight=geodesic(test_nodes_coords[3], test_nodes_coords[2]).meters)
+    test_graph.add_edge(0, 1, weight=geodesic(test_nodes_coords[0], test_nodes_coords[1]).meters)
+    test_graph.add_edge(1, 2, weight=geodesic(test_nodes_coords[1], test_nodes_coords[2]).meters)
+    test_graph.add_edge(2, 0, weight=geodesic(test_nodes_coords[2], test_nodes_coords[0]).meters) # Makes a 3-cycle
+    test_graph.add_edge(0, 3, weight=geodesic(test_nodes_coords[0], test_nodes_coords[3]).meters)
+    test_graph.add_edge(3, 2, weight=geodesic(test_nodes_coords[3], test_nodes_coords[2]).meters)
 
 
     print("--- Testing ACO Solver ---")
@@ -0,0 +1,219 @@
+import numpy as np
+from numba import njit, prange
+
+# fastmath without the no-inf/no-nan assumptions: unreachable pairs have
+# infinite distance and must stay infinite in the tour lengths
+_FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+# Lower bound for pheromone entries: repeated evaporation of unused edges
+# would otherwise drift into float32 denormals, which are slow to compute with
+PHEROMONE_FLOOR = np.float32(1e-30)
+
+
+@njit(parallel=True, cache=True, fastmath=_FASTMATH)
+def aco_iterate(dist, attractiveness, candidates, num_ants, start):
+    """
+    Builds one closed tour per ant over all nodes, starting and ending at start.
+
+    Each step picks the next unvisited node j with probability proportional
+    to attractiveness[cur, j], looking only at the unvisited nodes of cur's
+    candidate list. Once all candidates are visited the step falls back to
+    every unvisited node, and if only unreachable nodes are left, one of
+    them is picked uniformly.
+
+    Args:
+        dist: (n, n) shortest-path distance matrix
+        attractiveness: (n, n) float32 pheromone**alpha * heuristic**beta table
+        candidates: (n, k) indices of each node's k nearest nodes (see candidate_lists)
+        num_ants: Number of tours to build
+        start: Start node index
+
+    Returns:
+        A (tours, lengths) tuple: tours is (num_ants, n + 1) node indices,
+        lengths the matching tour lengths.
+    """
+    n = dist.shape[0]
+    num_candidates = candidates.shape[1]
+    tours = np.empty((num_ants, n + 1), dtype=np.int64)
+    lengths = np.empty(num_ants, dtype=np.float64)
+
+    for k in prange(num_ants):
+        visited = np.zeros(n, dtype=np.bool_)
+        cdf = np.empty(n, dtype=np.float32)
+        candidate_cdf = np.empty(num_candidates, dtype=np.float32)
+        cur = start
+        visited[cur] = True
+        tours[k, 0] = cur
+        length = 0.0
+
+        for step in range(1, n):
+            # Cumulative attractiveness over the unvisited candidates; visited
+            # nodes add nothing, so they leave flat steps in the CDF
+            total = np.float32(0.0)
+            for c in range(num_candidates):
+                j = candidates[cur, c]
+                if not visited[j]:
+                    total += attractiveness[cur, j]
+                candidate_cdf[c] = total
+
+            nxt = -1
+            if total > 0.0:
+                # Roulette-wheel selection: the first CDF entry strictly above r
+                # always belongs to an unvisited node with nonzero weight
+                r = np.float32(np.random.random()) * total
+                c = np.searchsorted(candidate_cdf, r, side='right')
+                if c == num_candidates:
+                    # r rounded up to total; take the last unvisited candidate
+                    c = num_candidates - 1
+                    while visited[candidates[cur, c]]:
+                        c -= 1
+                nxt = candidates[cur, c]
+            else:
+                # No unvisited candidate is reachable; same selection over
+                # every node
+                for j in range(n):
+                    if not visited[j]:
+                        total += attractiveness[cur, j]
+                    cdf[j] = total
+
+                if total > 0.0:
+                    r = np.float32(np.random.random()) * total
+                    nxt = np.searchsorted(cdf, r, side='right')
+                    if nxt == n:
+                        nxt = n - 1
+                        while visited[nxt]:
+                            nxt -= 1
+                else:
+                    pick = np.random.randint(n - step)
+                    for j in range(n):
+                        if not visited[j]:
+                            if pick == 0:
+                                nxt = j
+                                break
+                            pick -= 1
+
+            visited[nxt] = True
+            tours[k, step] = nxt
+            length += dist[cur, nxt]
+            cur = nxt
+
+        tours[k, n] = start
+        lengths[k] = length + dist[cur, start]
+
+    return tours, lengths
+
+
+@njit(cache=True)
+def nearest_neighbour_tour(dist, start):
+    """
+    Builds the greedy nearest-neighbour tour from start: each step moves to
+    the closest unvisited node.
+
+    Args:
+        dist: (n, n) shortest-path distance matrix
+        start: Start node index
+
+    Returns:
+        A (tour, length) tuple: tour is the (n + 1,) closed node sequence.
+    """
+    n = dist.shape[0]
+    tour = np.empty(n + 1, dtype=np.int64)
+    visited = np.zeros(n, dtype=np.bool_)
+    cur = start
+    visited[cur] = True
+    tour[0] = cur
+    length = 0.0
+
+    for step in range(1, n):
+        nxt = -1
+        best = np.inf
+        for j in range(n):
+            if not visited[j] and (nxt == -1 or dist[cur, j] < best):
+                nxt = j
+                best = dist[cur, j]
+        visited[nxt] = True
+        tour[step] = nxt
+        length += best
+        cur = nxt
+
+    tour[n] = start
+    return tour, length + dist[cur, start]
+
+
+def candidate_lists(dist, k):
+    """
+    Lists each node's k nearest other nodes by shortest-path distance.
+
+    Args:
+        dist: (n, n) shortest-path distance matrix
+        k: Candidate list size, at most n - 1
+
+    Returns:
+        An (n, k) int64 array; row i holds the candidates of node i.
+    """
+    # Column 0 of the sorted rows is the node itself (distance 0)
+    return np.ascontiguousarray(np.argsort(dist, axis=1, kind='stable')[:, 1:k + 1], dtype=np.int64)
+
+
+def table_power(table, exponent):
+    """
+    Raises a float32 table to exponent elementwise.
+
+    Small integer exponents (the defaults alpha=1, beta=3) are computed with
+    plain multiplications instead of a pow call per entry; 1 returns the
+    table itself.
+
+    Args:
+        table: float32 array
+        exponent: Power to raise the table to
+
+    Returns:
+        A float32 array of the same shape.
+    """
+    if exponent == 1.0:
+        return table
+    if exponent == int(exponent) and 2 <= exponent <= 4:
+        result = table * table
+        for _ in range(int(exponent) - 2):
+            result *= table
+        return result
+    return table ** np.float32(exponent)
+
+
+def heuristic_table(dist, beta):
+    """
+    Builds the float32 heuristic table (1 / distance) ** beta.
+
+    Zero-length pairs (the diagonal) and unreachable pairs get 0. The table
+    is float32: selection only needs relative weights, and the per-iteration
+    passes over it are memory-bound.
+
+    Args:
+        dist: (n, n) shortest-path distance matrix
+        beta: Heuristic influence factor
+
+    Returns:
+        An (n, n) float32 array.
+    """
+    eta = np.divide(1.0, dist, out=np.zeros_like(dist), where=dist > 0).astype(np.float32)
+    return table_power(eta, beta)
+
+
+def update_pheromone(pheromone, tours, lengths, evaporation_rate):
+    """
+    Evaporates the pheromone table in place, then lets every ant deposit
+    pheromone inversely to its tour length on both directions of its edges.
+    Evaporated entries are clamped to PHEROMONE_FLOOR.
+
+    Args:
+        pheromone: (n, n) float32 pheromone table, updated in place
+        tours: (num_ants, n + 1) closed tours from aco_iterate
+        lengths: (num_ants,) tour lengths
+        evaporation_rate: Fraction of pheromone that evaporates (rho)
+    """
+    pheromone *= np.float32(1.0 - evaporation_rate)
+    np.maximum(pheromone, PHEROMONE_FLOOR, out=pheromone)
+    src, dst = tours[:, :-1].ravel(), tours[:, 1:].ravel()
+    delta = np.repeat((1.0 / lengths).astype(np.float32), tours.shape[1] - 1)
+    np.add.at(pheromone, (src, dst), delta)
+    np.add.at(pheromone, (dst, src), delta)